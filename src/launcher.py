@@ -8,11 +8,9 @@ from pathlib import Path
 from tkinter import filedialog, ttk
 
 from .storage import (
-    EXTENSION,
-    PATH_STORAGE,
     add_folder_to_library,
     clean_non_existing_folders_from_library,
-    list_all_files_with_ext,
+    list_mdlz_files,
     load_library_data,
     unpack_file_to_temp,
 )
@@ -75,7 +73,7 @@ class LibraryLauncher:
             ).pack(fill="x", pady=5, padx=6, expand=True)
 
         # List the saved files
-        for entry_path in list_all_files_with_ext(PATH_STORAGE, EXTENSION):
+        for entry_path in list_mdlz_files():
             ttk.Button(
                 scrollable_frame,
                 text=entry_path.stem,
@@ -7,29 +7,76 @@ representation used for storage.
 
 from __future__ import annotations
 
-import glob
+import copy
 import json
 import logging
+import mmap
 import os
-import re
+import shutil
+import tarfile
 import tempfile
 import zipfile
-from pathlib import Path, PureWindowsPath
-from typing import List, Union
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+# Optional zstandard support for archives written as zstd-compressed tar streams
+try:
+    import zstandard
+
+    ZSTD_AVAILABLE: bool = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Optional orjson for faster library.json reads
+try:
+    import orjson
+
+    ORJSON_AVAILABLE: bool = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 EXTENSION = "mdlz"
 PATH_STORAGE = Path(__file__).parent.parent / "storage"
 PATH_LIBRARY = Path(__file__).parent.parent / "library.json"
+PATH_CACHE = PATH_STORAGE / ".cache"
 DEFAULT_LIBRARY_STRUCTURE = {"folders": []}
+# chunk size when copying archive members, far above zipfile's 8 KiB default
+COPY_BUFFER_SIZE = 1 << 20
+# files below this size are stored as-is, compressing them saves next to nothing
+STORE_BELOW_SIZE = 4096
+# files below this size are read ahead by PACK_READ_WORKERS threads while packing,
+# larger ones are streamed from disk so the read-ahead window stays a few MiB
+PREFETCH_BELOW_SIZE = COPY_BUFFER_SIZE
+PACK_READ_WORKERS = 4
+# archives below this size are memory-mapped while reading, larger ones could
+# exhaust the address space of a 32-bit interpreter
+MMAP_BELOW_SIZE = 512 << 20
+# first bytes of a zstd frame, tells the two archive layouts apart
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# formats that are compressed already, deflating them again only costs time
+PRECOMPRESSED_SUFFIXES = frozenset({".png", ".jpg", ".jpeg", ".gif", ".webp", ".zip", ".mdlz", ".pdf", ".mp4"})
+# written by unpack_file_to_temp, names the archive a temporary folder was extracted from
+PACKED_SOURCE_MARKER = ".mdlz_src"
 
 if not PATH_STORAGE.exists():
     PATH_STORAGE.mkdir(parents=True, exist_ok=True)
 
+if not PATH_CACHE.exists():
+    PATH_CACHE.mkdir(parents=True, exist_ok=True)
+
 if not PATH_LIBRARY.exists():
     with open(PATH_LIBRARY, "w", encoding="utf-8") as f:
         json.dump(DEFAULT_LIBRARY_STRUCTURE, f, indent=4)
 
 
+def _is_win_drive(path: str) -> bool:
+    """Return True if ``path`` starts with a Windows drive root like 'C:\\' or 'C:/'."""
+    return len(path) >= 3 and path[0].isascii() and path[0].isalpha() and path[1] == ":" and path[2] in "\\/"
+
+
 def _is_absolute_path(path: str) -> bool:
     """Return True if ``path`` is an absolute path on Windows or Unix.
 
@@ -41,7 +88,7 @@ def _is_absolute_path(path: str) -> bool:
         return True
 
     # Windows absolute: C:\ or C:/
-    if re.match(r"^[A-Za-z]:[\\\\/]", path):
+    if _is_win_drive(path):
         return True
 
     return False
@@ -59,29 +106,17 @@ def flatten_path(path_str: str) -> str:
     if not _is_absolute_path(path_str):
         raise ValueError(f"Path must be absolute: {path_str}")
 
-    # If the string is a Windows drive-style path (e.g. C:\ or C:/), parse
-    # it with PureWindowsPath so the drive root and path components are
-    # recognized consistently on all platforms.
-    if re.match(r"^[A-Za-z]:[\\\\/]", path_str):
-        parts = list(PureWindowsPath(path_str).parts)
+    # Keep the drive letter of a Windows path (e.g. C:\ or C:/) and drop the
+    # root; both separators split on every platform, like PureWindowsPath does
+    if _is_win_drive(path_str):
+        cleaned: List[str] = [path_str[0]]
+        rest = path_str[3:]
     else:
-        parts = list(Path(path_str).parts)
-
-    # Remove root markers like "/" or "\\" or "C:\\"
-    # Windows: ('C:\\', 'Users', 'anoth', 'Documents')
-    # Linux:   ('/', 'mnt', 'hdd1', 'docs')
-    cleaned: List[str] = []
-
-    for part in parts:
-        # Windows drive root like "C:\\"
-        if part.endswith(":\\") or part.endswith(":/"):
-            cleaned.append(part.rstrip("\\/").rstrip(":"))
-        # Linux root "/"
-        elif part in ("/", "\\"):
-            continue
-        else:
-            cleaned.append(part)
+        cleaned = []
+        rest = path_str[1:]
 
+    # empty parts come from repeated or trailing separators, "." is a no-op
+    cleaned.extend(part for part in rest.replace("\\", "/").split("/") if part and part != ".")
     return "_".join(cleaned)
 
 
@@ -90,7 +125,183 @@ def is_mdlz_file(file_path: str) -> bool:
 
     The check is case-insensitive.
     """
-    return file_path.lower().endswith(EXTENSION)
+    # only the suffix is lower-cased, not the whole path
+    return os.path.splitext(file_path)[1].lower() == f".{EXTENSION}"
+
+
+def _member_target(extract_to: str, member_name: str) -> str:
+    """Return where ``member_name`` is extracted below ``extract_to``.
+
+    Like ``ZipFile.extractall``, drive letters, empty parts, ``.`` and ``..``
+    are dropped so a member can never be written outside ``extract_to``.
+    """
+    name = os.path.splitdrive(member_name.replace("\\", "/"))[1]
+    parts = [part for part in name.split("/") if part not in ("", ".", "..")]
+    return os.path.join(extract_to, *parts)
+
+
+class _MappedFile(mmap.mmap):
+    """A read-only `mmap.mmap` that `zipfile.ZipFile` accepts as a file object."""
+
+    def seekable(self) -> bool:
+        return True
+
+
+@contextmanager
+def _open_zip(zip_path: str) -> Iterator[zipfile.ZipFile]:
+    """Open the zip archive at ``zip_path`` for reading.
+
+    Archives smaller than `MMAP_BELOW_SIZE` are memory-mapped, so parsing the
+    central directory and the per-member headers takes no seek or read calls.
+    Each call maps the file anew, the mapping's position is not thread-safe.
+    """
+    size = os.path.getsize(zip_path)
+    if not 0 < size < MMAP_BELOW_SIZE:
+        with zipfile.ZipFile(zip_path, "r") as zipf:
+            yield zipf
+        return
+
+    with open(zip_path, "rb") as fh, _MappedFile(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with zipfile.ZipFile(mm, "r") as zipf:
+            yield zipf
+
+
+def _extract_members(zip_path: str, members: List[Tuple[zipfile.ZipInfo, str]]) -> None:
+    """Extract each ``(member, target)`` pair of the archive at ``zip_path``.
+
+    Members are copied in `COPY_BUFFER_SIZE` chunks, so large files take far
+    fewer read and write calls than with ``ZipFile.extractall``. The archive is
+    opened here because a `zipfile.ZipFile` must not be shared between threads.
+    The target folders must exist already.
+    """
+    with _open_zip(zip_path) as zipf:
+        for info, target in members:
+            with zipf.open(info) as src, open(target, "wb", buffering=COPY_BUFFER_SIZE) as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+
+
+def _extract_all(zip_path: str, extract_to: str) -> Dict[str, int]:
+    """Extract every member of the archive at ``zip_path`` into ``extract_to``.
+
+    All folders are created up front, once each, so the workers never race on
+    ``mkdir``. zlib releases the GIL while inflating, so the files are then
+    split into one shard per CPU and each shard is extracted by its own thread.
+    Returns the size of each extracted file by its path relative to ``extract_to``.
+    """
+    if _is_zstd_archive(zip_path):
+        return _extract_zstd(zip_path, extract_to)
+
+    with _open_zip(zip_path) as zipf:
+        infos = zipf.infolist()
+
+    folders: Set[str] = set()
+    files: List[Tuple[zipfile.ZipInfo, str]] = []
+    for info in infos:
+        target = _member_target(extract_to, info.filename)
+        if info.is_dir():
+            folders.add(target)
+        else:
+            folders.add(os.path.dirname(target))
+            files.append((info, target))
+
+    for folder in sorted(folders):
+        os.makedirs(folder, exist_ok=True)
+
+    prefix_len = len(os.path.join(extract_to, ""))
+    sizes = {target[prefix_len:]: info.file_size for info, target in files}
+
+    workers = max(1, min(os.cpu_count() or 1, len(files)))
+    if workers == 1:
+        _extract_members(zip_path, files)
+        return sizes
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # consume the results so a failed member raises here
+        list(pool.map(lambda shard: _extract_members(zip_path, files[shard::workers]), range(workers)))
+    return sizes
+
+
+def _is_zstd_archive(zip_path: str) -> bool:
+    """Return True if the archive at ``zip_path`` is a zstd stream, not a zip."""
+    with open(zip_path, "rb") as f:
+        return f.read(len(ZSTD_MAGIC)) == ZSTD_MAGIC
+
+
+def _extract_zstd(zip_path: str, extract_to: str) -> Dict[str, int]:
+    """Extract the zstd-compressed tar archive at ``zip_path`` into ``extract_to``.
+
+    Only regular files and folders are extracted, with member names sanitised
+    by `_member_target`; links and special files are skipped. Returns the
+    size of each extracted file by its path relative to ``extract_to``.
+    """
+    if not ZSTD_AVAILABLE:
+        raise RuntimeError(f"The zstandard package is required to open '{zip_path}'")
+
+    prefix_len = len(os.path.join(extract_to, ""))
+    sizes: Dict[str, int] = {}
+    with open(zip_path, "rb") as fh, zstandard.ZstdDecompressor().stream_reader(fh) as zst:
+        with tarfile.open(fileobj=zst, mode="r|") as tar:
+            for member in tar:
+                target = _member_target(extract_to, member.name)
+                if member.isdir():
+                    os.makedirs(target, exist_ok=True)
+                elif member.isfile():
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with tar.extractfile(member) as src, open(target, "wb", buffering=COPY_BUFFER_SIZE) as dst:
+                        shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+                    sizes[target[prefix_len:]] = member.size
+    return sizes
+
+
+def _packed_source(folder_path: str) -> Optional[str]:
+    """Return the archive ``folder_path`` was extracted from, if nothing changed since.
+
+    Only folders created by `unpack_file_to_temp` carry a `PACKED_SOURCE_MARKER`.
+    The folder is unchanged while the archive keeps its mtime and size, no
+    entry in the folder is newer than the marker and it holds exactly the
+    extracted files with their sizes; adding, removing or renaming a file fails
+    these checks, and so does an edit unless it keeps both mtime and size.
+    """
+    marker = os.path.join(folder_path, PACKED_SOURCE_MARKER)
+    try:
+        marker_mtime = os.stat(marker).st_mtime_ns
+        with open(marker, "r", encoding="utf-8") as f:
+            source = json.load(f)
+        stat = os.stat(source["path"])
+        if (stat.st_mtime_ns, stat.st_size) != (source["mtime_ns"], source["size"]):
+            return None
+
+        sizes = source["files"]
+        # every walked path starts with the folder and a separator
+        prefix_len = len(os.path.join(folder_path, ""))
+        files = 0
+        stack = [folder_path]
+        while stack:
+            folder = stack.pop()
+            if os.stat(folder).st_mtime_ns > marker_mtime:
+                return None
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if entry.path == marker:
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime_ns > marker_mtime or sizes.get(entry.path[prefix_len:]) != stat.st_size:
+                        return None
+                    files += 1
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+    return source["path"] if files == len(sizes) else None
+
+
+def _copy_packed_source(source: str, zip_path: Union[str, Path]) -> None:
+    """Copy the archive ``source`` to ``zip_path`` instead of packing it again."""
+    if os.path.abspath(str(zip_path)) != source:
+        shutil.copyfile(source, str(zip_path))
+    logging.debug(f"Copied unchanged archive '{source}' → '{zip_path}'")
 
 
 def unpack_file(zip_path: Union[str, Path], extract_to: Union[str, Path]) -> None:
@@ -103,62 +314,206 @@ def unpack_file(zip_path: Union[str, Path], extract_to: Union[str, Path]) -> Non
 
     os.makedirs(extract_to, exist_ok=True)
 
-    with zipfile.ZipFile(zip_path, "r") as zipf:
-        zipf.extractall(extract_to)
+    _extract_all(zip_path, extract_to)
 
     logging.debug(f"Extracted '{zip_path}' → '{extract_to}'")
 
 
-def pack_folder(folder_path: Union[str, Path], zip_path: Union[str, Path]) -> None:
+def pack_folder(
+    folder_path: Union[str, Path],
+    zip_path: Union[str, Path],
+    compression: int = zipfile.ZIP_DEFLATED,
+    compresslevel: int = 3,
+) -> None:
     """Compress ``folder_path`` into a zip archive at ``zip_path``.
 
     ``folder_path`` may be a directory path; the archive will contain the
-    folder's files with relative paths.
+    folder's files with relative paths. Files smaller than `STORE_BELOW_SIZE`
+    and files in `PRECOMPRESSED_SUFFIXES` formats are stored uncompressed,
+    everything else uses ``compression`` at ``compresslevel``. The default
+    level 3 keeps nearly all of deflate's ratio on Markdown at a fraction of
+    the default level 6 cost; pass 1 for the fastest save or 9 for archival.
+
+    A folder extracted by `unpack_file_to_temp` and left unchanged is not
+    packed again, its zip archive is copied to ``zip_path`` as it is.
     """
     folder_path = os.path.abspath(str(folder_path))
-
-    with zipfile.ZipFile(str(zip_path), "w", zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                abs_file = os.path.join(root, file)
-                rel_path = os.path.relpath(abs_file, folder_path)
-                zipf.write(abs_file, rel_path)
+    source = _packed_source(folder_path)
+    if source is not None and not _is_zstd_archive(source):
+        _copy_packed_source(source, zip_path)
+        return
+
+    # every walked path starts with the folder and a separator
+    prefix_len = len(os.path.join(folder_path, ""))
+    marker = os.path.join(folder_path, PACKED_SOURCE_MARKER)
+
+    def read_member(abs_file: str) -> Tuple[zipfile.ZipInfo, Optional[bytes]]:
+        zinfo = zipfile.ZipInfo.from_file(abs_file, abs_file[prefix_len:], strict_timestamps=False)
+        store = os.path.splitext(abs_file)[1].lower() in PRECOMPRESSED_SUFFIXES or zinfo.file_size < STORE_BELOW_SIZE
+        zinfo.compress_type = zipfile.ZIP_STORED if store else compression
+        if zinfo.file_size >= PREFETCH_BELOW_SIZE:
+            return zinfo, None
+        with open(abs_file, "rb") as f:
+            return zinfo, f.read()
+
+    with open(str(zip_path), "wb", buffering=COPY_BUFFER_SIZE) as fh:
+        # files dated before 1980 get the earliest zip timestamp instead of failing the save
+        with zipfile.ZipFile(fh, "w", compression, compresslevel=compresslevel, strict_timestamps=False) as zipf:
+            # worker threads read the next files while this thread compresses,
+            # a bounded window keeps memory use flat on large folders
+            with ThreadPoolExecutor(max_workers=PACK_READ_WORKERS) as pool:
+                window: Deque[Tuple[str, "Future[Tuple[zipfile.ZipInfo, Optional[bytes]]]"]] = deque()
+
+                def write_oldest() -> None:
+                    abs_file, future = window.popleft()
+                    zinfo, data = future.result()
+                    if data is not None:
+                        zipf.writestr(zinfo, data, compresslevel=compresslevel)
+                    elif zinfo.compress_type == zipfile.ZIP_STORED:
+                        # ZipFile.write copies in 8 KiB chunks, far too small when nothing is compressed
+                        with open(abs_file, "rb") as src, zipf.open(zinfo, "w") as dst:
+                            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+                    else:
+                        zipf.write(abs_file, zinfo.filename, compress_type=zinfo.compress_type)
+
+                for abs_file in _iter_files_with_ext(folder_path, "", include_hidden=True, follow_symlinks=False):
+                    if abs_file == marker:
+                        continue
+                    window.append((abs_file, pool.submit(read_member, abs_file)))
+                    if len(window) >= 2 * PACK_READ_WORKERS:
+                        write_oldest()
+                while window:
+                    write_oldest()
 
     logging.debug(f"Compressed '{folder_path}' → '{zip_path}'")
 
 
+def pack_folder_zstd(folder_path: Union[str, Path], zip_path: Union[str, Path], level: int = 3) -> None:
+    """Compress ``folder_path`` into a zstd-compressed tar archive at ``zip_path``.
+
+    A faster alternative to `pack_folder` that needs the optional zstandard
+    package; libzstd compresses on all cores. `unpack_file` and
+    `unpack_file_to_temp` recognise both archive layouts by their first bytes.
+    An unchanged folder extracted from a zstd archive is copied like in `pack_folder`.
+    """
+    if not ZSTD_AVAILABLE:
+        raise RuntimeError("The zstandard package is required to write zstd archives")
+
+    folder_path = os.path.abspath(str(folder_path))
+    source = _packed_source(folder_path)
+    if source is not None and _is_zstd_archive(source):
+        _copy_packed_source(source, zip_path)
+        return
+
+    # every walked path starts with the folder and a separator
+    prefix_len = len(os.path.join(folder_path, ""))
+    marker = os.path.join(folder_path, PACKED_SOURCE_MARKER)
+
+    with open(str(zip_path), "wb") as fh:
+        with zstandard.ZstdCompressor(level=level, threads=-1).stream_writer(fh) as zst:
+            # dereference stores a linked file's content, as pack_folder does; the extractor skips links
+            with tarfile.open(fileobj=zst, mode="w|", dereference=True) as tar:
+                for abs_file in _iter_files_with_ext(folder_path, "", include_hidden=True, follow_symlinks=False):
+                    if abs_file == marker:
+                        continue
+                    tar.add(abs_file, arcname=abs_file[prefix_len:].replace(os.sep, "/"), recursive=False)
+
+    logging.debug(f"Compressed '{folder_path}' → '{zip_path}' with zstd")
+
+
 def unpack_file_to_temp(zip_path: Union[str, Path]) -> str:
     """Unpack ``zip_path`` into a newly-created temporary directory.
 
     Returns the path to the temporary directory as a string. Caller is
-    responsible for cleaning it up.
+    responsible for cleaning it up. The directory also holds a
+    `PACKED_SOURCE_MARKER` so saving it unchanged just copies ``zip_path``.
     """
     zip_path = os.path.abspath(str(zip_path))
 
     # stays alive until YOU delete it, the files should be small, good luck
     extract_to = tempfile.mkdtemp()
 
-    with zipfile.ZipFile(zip_path, "r") as zipf:
-        zipf.extractall(extract_to)
+    files = _extract_all(zip_path, extract_to)
+
+    # written last, everything extracted is at most as new as the marker
+    stat = os.stat(zip_path)
+    with open(os.path.join(extract_to, PACKED_SOURCE_MARKER), "w", encoding="utf-8") as f:
+        json.dump({"path": zip_path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "files": files}, f)
 
     return extract_to
 
 
-def load_library_data() -> dict:
-    """Load the library data from PATH_LIBRARY.
+# parsed library.json contents with the (mtime_ns, size) they were read at and
+# a set mirror of its folders for O(1) membership, keyed by the file they were read from
+_LIBRARY_CACHE: Dict[Path, Tuple[Tuple[int, int], dict, Set[str]]] = {}
+
 
-    If the file does not exist, returns an empty library structure.
+def _library_signature() -> Tuple[int, int]:
+    stat = os.stat(PATH_LIBRARY)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _load_library() -> Tuple[dict, Set[str]]:
+    """Return the library data and the set of its folders.
+
+    The parsed data is kept in memory and only read again once the file's
+    mtime or size changes, e.g. after another app instance saved a folder.
     """
-    if not PATH_LIBRARY.exists():
-        return DEFAULT_LIBRARY_STRUCTURE
+    try:
+        signature = _library_signature()
+    except OSError:
+        return copy.deepcopy(DEFAULT_LIBRARY_STRUCTURE), set()
+
+    cached = _LIBRARY_CACHE.get(PATH_LIBRARY)
+    if cached is not None and cached[0] == signature:
+        return cached[1], cached[2]
 
     try:
-        with open(PATH_LIBRARY, "r", encoding="utf-8") as f:
-            library_data = json.load(f)
-        return library_data
+        if ORJSON_AVAILABLE:
+            library_data = orjson.loads(PATH_LIBRARY.read_bytes())
+        else:
+            with open(PATH_LIBRARY, "r", encoding="utf-8") as f:
+                library_data = json.load(f)
     except Exception as e:
         logging.error(f"Error loading library.json: {e}")
-        return DEFAULT_LIBRARY_STRUCTURE
+        return copy.deepcopy(DEFAULT_LIBRARY_STRUCTURE), set()
+
+    folders = set(library_data.get("folders", []))
+    _LIBRARY_CACHE[PATH_LIBRARY] = (signature, library_data, folders)
+    return library_data, folders
+
+
+def load_library_data() -> dict:
+    """Load the library data from PATH_LIBRARY.
+
+    If the file does not exist, returns an empty library structure. Repeated
+    loads of an unchanged file are served from memory; the result is a copy the
+    caller may change freely.
+    """
+    return copy.deepcopy(_load_library()[0])
+
+
+def _write_library_data(library_data: dict) -> None:
+    """Write ``library_data`` to PATH_LIBRARY and remember it as the cached copy.
+
+    The data goes to a temporary file that then replaces PATH_LIBRARY, so a
+    crash mid-write never leaves a truncated library.json behind. On failure
+    the temporary file is removed and the cached copy is left as it was.
+    """
+    # a plain open creates the file with the umask's mode, like writing library.json directly
+    tmp_path = PATH_LIBRARY.with_name(f"{PATH_LIBRARY.name}.{os.getpid()}.tmp")
+    try:
+        # always the json module, the file looks the same whether or not orjson is installed
+        with open(tmp_path, "wb") as wf:
+            wf.write(json.dumps(library_data, indent=4).encode("utf-8"))
+        os.replace(tmp_path, PATH_LIBRARY)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _LIBRARY_CACHE[PATH_LIBRARY] = (_library_signature(), library_data, set(library_data.get("folders", [])))
 
 
 def add_folder_to_library(folder: str) -> None:
@@ -166,24 +521,98 @@ def add_folder_to_library(folder: str) -> None:
 
     If the folder is already present, it will not be added again.
     """
-    library_data = load_library_data()
+    library_data, folders = _load_library()
+
+    # the cached data only changes once the new file is written
+    if folder not in folders:
+        _write_library_data({**library_data, "folders": [*library_data.get("folders", []), folder]})
+
+
+def _iter_files_with_ext(
+    folder_path: str, suffix: str, include_hidden: bool = False, follow_symlinks: bool = True
+) -> Iterator[str]:
+    """Yield paths of files below ``folder_path`` whose name ends in ``suffix``.
+
+    Uses ``os.scandir`` so file types come from the directory listing itself
+    instead of one ``stat`` per entry. Hidden entries are skipped unless
+    ``include_hidden`` is set, matching what the previous ``glob`` based
+    listing returned. Symlinked folders are followed like ``glob`` did unless
+    ``follow_symlinks`` is False; every real folder is walked once, so link
+    cycles end.
+    """
+    # a plain subfolder's real path is its parent's plus its name, only links need realpath
+    root_real = os.path.realpath(folder_path)
+    visited = {root_real}
+    stack = [(folder_path, root_real)]
+    while stack:
+        folder, folder_real = stack.pop()
+        try:
+            entries = os.scandir(folder)
+        except OSError as e:
+            logging.debug(f"Skipping unreadable folder: {e}")
+            continue
 
-    if folder not in library_data.get("folders", []):
-        library_data.setdefault("folders", []).append(folder)
-        with open(PATH_LIBRARY, "w", encoding="utf-8") as wf:
-            json.dump(library_data, wf, indent=4)
+        with entries:
+            for entry in entries:
+                if not include_hidden and entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    real = os.path.join(folder_real, entry.name)
+                elif follow_symlinks and entry.is_symlink() and entry.is_dir():
+                    real = os.path.realpath(entry.path)
+                else:
+                    if entry.name.endswith(suffix) and entry.is_file():
+                        yield entry.path
+                    continue
+                if real not in visited:
+                    visited.add(real)
+                    stack.append((entry.path, real))
 
 
 def list_all_files_with_ext(folder_path: Union[str, Path], ext: str) -> List[Path]:
     """Recursively list all files in the specified folder with given extension.
 
-    Returns a list of `Path` objects.
+    The extension check is case-sensitive. Returns a sorted list of `Path` objects.
     """
     logging.debug(f"Listing all .{ext} files in folder: {folder_path}")
-    files = glob.glob(str(Path(folder_path) / f"**/*.{ext}"), recursive=True)
+    files = _iter_files_with_ext(str(folder_path), f".{ext}")
     return sorted([Path(f) for f in files])
 
 
+# sorted archive listing with the storage folder mtime_ns it was read at,
+# keyed by the storage folder it was read from
+_MDLZ_CACHE: Dict[Path, Tuple[int, List[Path]]] = {}
+
+
+def list_mdlz_files() -> List[Path]:
+    """List the `.mdlz` archives saved directly in PATH_STORAGE.
+
+    The extension check is case-sensitive, like `list_all_files_with_ext`.
+    A single ``os.scandir`` pass is used, archives are only ever saved at the
+    top of the storage folder. Adding, removing or renaming an archive changes
+    the folder's mtime, so the listing is only rescanned when it moved.
+    Returns a sorted list of `Path` objects.
+    """
+    mtime_ns = os.stat(PATH_STORAGE).st_mtime_ns
+    cached = _MDLZ_CACHE.get(PATH_STORAGE)
+    if cached is None or cached[0] != mtime_ns:
+        suffix = f".{EXTENSION}"
+        with os.scandir(PATH_STORAGE) as entries:
+            files = sorted(Path(e.path) for e in entries if e.name.endswith(suffix) and e.is_file())
+        cached = _MDLZ_CACHE[PATH_STORAGE] = (mtime_ns, files)
+    # a copy, callers may modify the list
+    return list(cached[1])
+
+
+def list_all_files(folder_path: Union[str, Path]) -> Set[str]:
+    """Recursively collect the paths of all files in the specified folder.
+
+    Hidden entries are skipped like in `list_all_files_with_ext`. The result is
+    a set of path strings meant for cheap membership tests.
+    """
+    return set(_iter_files_with_ext(str(folder_path), ""))
+
+
 def gen_init_index_json(path_to_folder: Union[str, Path]) -> None:
     """Generate an initial index.json file in the specified folder.
 
@@ -196,7 +625,8 @@ def gen_init_index_json(path_to_folder: Union[str, Path]) -> None:
     path_to_folder = str(path_to_folder)
     index_path = os.path.join(path_to_folder, "index.json")
 
-    entries = [str(p) for p in list_all_files_with_ext(path_to_folder, "md")]
+    # same order as list_all_files_with_ext, without the round trip through Path
+    entries = sorted(_iter_files_with_ext(path_to_folder, ".md"), key=lambda f: f.split(os.sep))
     initial_index = {"entries": entries}
 
     with open(index_path, "w", encoding="utf-8") as f:
@@ -207,12 +637,17 @@ def gen_init_index_json(path_to_folder: Union[str, Path]) -> None:
 
 def clean_non_existing_folders_from_library() -> None:
     """Remove non-existing folder paths from the library.json file."""
-    library_data = load_library_data()
+    library_data = _load_library()[0]
     folders = library_data.get("folders", [])
-    existing_folders = [f for f in folders if Path(f).exists()]
+
+    # overlap the stat calls, they dominate on network drives; a handful are cheaper inline
+    if len(folders) > 8:
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            exists = list(pool.map(os.path.exists, folders))
+    else:
+        exists = [os.path.exists(f) for f in folders]
+    existing_folders = [f for f, ok in zip(folders, exists) if ok]
 
     if len(existing_folders) != len(folders):
-        library_data["folders"] = existing_folders
-        with open(PATH_LIBRARY, "w", encoding="utf-8") as wf:
-            json.dump(library_data, wf, indent=4)
+        _write_library_data({**library_data, "folders": existing_folders})
         logging.debug("Cleaned non-existing folders from library.json")
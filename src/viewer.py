@@ -1,31 +1,36 @@
+import hashlib
+import itertools
 import logging
+import mmap
+import multiprocessing
 import os
+import pickle
 import re
 import shutil
+import tempfile
+import threading
+import time
 import tkinter as tk
 import webbrowser
-from enum import Enum, auto
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 from tkinter import filedialog, ttk
-from typing import Any, Callable, Dict, List, Tuple
+from tkinter import font as tkfont
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
 
 from .storage import (
+    PACKED_SOURCE_MARKER,
+    PATH_CACHE,
     PATH_STORAGE,
+    ZSTD_AVAILABLE,
     add_folder_to_library,
     flatten_path,
     gen_init_index_json,
-    list_all_files_with_ext,
+    list_all_files,
     pack_folder,
+    pack_folder_zstd,
 )
 
-# Optional Pillow support for JPEG and others
-try:
-    from PIL import Image, ImageTk
-
-    PIL_AVAILABLE: bool = True
-except ImportError:
-    PIL_AVAILABLE = False
-
-
 # Optional mistune for proper Markdown parsing
 try:
     import mistune
@@ -35,18 +40,23 @@ except Exception:
     MISTUNE_AVAILABLE = False
 
 
+# Patterns used on every rendered document, compiled once at import
+# a fenced code block: opening fence line, body, closing fence line (or end of text)
+_FENCE_RE = re.compile(r"^[ \t]*```[^\n]*\n?(.*?)(?:^[ \t]*```[^\n]*$|\Z)", re.MULTILINE | re.DOTALL)
+# an inline link: [text](url)
+_LINK_RE = re.compile(r"\[(.*?)\]\((.*?)\)")
+
+
 # ============================================================
 # Inline Markdown Tokenizer
 # ============================================================
-class TokenType(Enum):
-    NORMAL = auto()
-    ITALIC = auto()
-    BOLD = auto()
-    BOLD_ITALIC = auto()
-    INLINE_CODE = auto()
-
-
-link_callbacks: Dict[str, Callable[[Any], Any]] = {}
+# token types are the Tk tag names they render with, so a token can be
+# inserted as is; plain text carries no tag
+NORMAL = ""
+ITALIC = "italic"
+BOLD = "bold"
+BOLD_ITALIC = "bold_italic"
+INLINE_CODE = "inlinecode"
 
 
 def on_click(event: Any, url: str) -> None:
@@ -55,339 +65,662 @@ def on_click(event: Any, url: str) -> None:
     webbrowser.open_new(url)
 
 
-def insert_hyperlink(
-    text_widget: tk.Text, start_index: str, end_index: str, url: str, callback_store: Dict[str, Callable[[Any], Any]]
-) -> None:
-    tag_name = f"hyperlink_{len(callback_store)}"
-    text_widget.tag_add(tag_name, start_index, end_index)
+def _on_link_click(event: Any) -> None:
+    # one handler for every link, the hyperlink_<n> tag under the pointer picks the url
+    widget = event.widget
+    for tag in widget.tag_names(f"@{event.x},{event.y}"):
+        if tag.startswith("hyperlink_"):
+            on_click(event, widget.md_links[int(tag[len("hyperlink_") :])])
+            return
 
-    # Bind click
-    callback_store[tag_name] = lambda e, url=url: on_click(e, url)
-    text_widget.tag_bind(tag_name, "<Button-1>", callback_store[tag_name])
 
-    # debugging line, it should not be empty
-    logging.debug("Tag ranges:", text_widget.tag_ranges(tag_name))
+def bind_hyperlinks(text_widget: tk.Text, links: List[str]) -> None:
+    # the urls live on the widget, so they go away with it or the next render
+    text_widget.md_links = links
+    if not text_widget.tag_bind("hyperlink", "<Button-1>"):
+        text_widget.tag_bind("hyperlink", "<Button-1>", _on_link_click)
 
 
-def tokenize_inline(line: str) -> List[Tuple[TokenType, str]]:
-    tokens: List[Tuple[TokenType, str]] = []
-    i = 0
-    n = len(line)
+def tokenize_inline(
+    line: str, pos: int = 0, endpos: Optional[int] = None, segments: Optional[List[Any]] = None
+) -> List[Any]:
+    # pos/endpos bound the scan like re.Pattern.search does, so callers can
+    # tokenize a stretch of a line without slicing it out first; the tokens go
+    # straight into the flat text/tag list (see append_segment), no tuple per token
+    if segments is None:
+        segments = []
+    i = pos
+    n = len(line) if endpos is None else endpos
 
     while i < n:
+        # jump straight to the next marker, everything before it is plain text
+        code_at = line.find("`", i, n)
+        star_at = line.find("*", i, n)
+        if code_at == -1:
+            code_at = n
+        if star_at == -1:
+            star_at = n
+        marker = min(code_at, star_at)
+        if marker > i:
+            append_segment(segments, line[i:marker])
+            i = marker
+            if i == n:
+                break
+
         # inline code
-        if line.startswith("`", i):
-            end = line.find("`", i + 1)
+        if line.startswith("`", i, n):
+            end = line.find("`", i + 1, n)
             if end != -1:
-                tokens.append((TokenType.INLINE_CODE, line[i + 1 : end]))
+                append_segment(segments, line[i + 1 : end], INLINE_CODE)
                 i = end + 1
                 continue
 
         # ***bold italic***
-        if line.startswith("***", i):
-            end = line.find("***", i + 3)
+        if line.startswith("***", i, n):
+            end = line.find("***", i + 3, n)
             if end != -1:
-                tokens.append((TokenType.BOLD_ITALIC, line[i + 3 : end]))
+                append_segment(segments, line[i + 3 : end], BOLD_ITALIC)
                 i = end + 3
                 continue
 
         # **bold**
-        if line.startswith("**", i):
-            end = line.find("**", i + 2)
+        if line.startswith("**", i, n):
+            end = line.find("**", i + 2, n)
             if end != -1:
-                tokens.append((TokenType.BOLD, line[i + 2 : end]))
+                append_segment(segments, line[i + 2 : end], BOLD)
                 i = end + 2
                 continue
 
         # *italic*
-        if line.startswith("*", i):
-            end = line.find("*", i + 1)
+        if line.startswith("*", i, n):
+            end = line.find("*", i + 1, n)
             if end != -1:
-                tokens.append((TokenType.ITALIC, line[i + 1 : end]))
+                append_segment(segments, line[i + 1 : end], ITALIC)
                 i = end + 1
                 continue
 
-        # normal char
-        tokens.append((TokenType.NORMAL, line[i]))
+        # unmatched marker
+        append_segment(segments, line[i])
         i += 1
 
-    return tokens
+    return segments
 
 
 # ============================================================
-# Markdown Renderer
+# Batched Text Insertion
+# ============================================================
+def append_segment(segments: List[Any], text: str, tags: Any = NORMAL) -> None:
+    # segments alternates text and tags, the layout Text.insert takes natively;
+    # merge with the previous run when it carries the same tags
+    if segments and segments[-1] == tags:
+        segments[-2] += text
+    else:
+        segments += [text, tags]
+
+
 # ============================================================
-def render_markdown_with_mistune(text_widget: tk.Text, content: str, image_cache: List[Any], base_folder: str) -> None:
+# Image Loading
+# ============================================================
+# Pillow decodes off the Tk thread; only the PhotoImage is built on the main loop
+_IMG_POOL = ThreadPoolExecutor(max_workers=4)
+_IMG_PLACEHOLDER = "[loading…]"
+_IMG_POLL_MS = 20
+# Pillow decoded pictures are scaled down to fit, bounding their memory
+_IMG_MAX_SIZE = (1600, 1600)
+_image_ids = itertools.count()
+
+# formats Tk decodes by itself, these never need Pillow
+_TK_IMAGE_SUFFIXES = (".png", ".gif")
+
+# decoded images keyed by absolute path, shared by all tabs, with the mtime of their file;
+# the rendering path never stats, the mtime is taken on the next reload and is None until then
+ImageCache = Dict[str, Tuple[Optional[int], Any]]
+
+
+@lru_cache(maxsize=None)
+def _pil_modules() -> Optional[Tuple[Any, Any]]:
+    # Optional Pillow support for JPEG and others, imported on the first image that needs it
     try:
-        md = mistune.create_markdown(renderer="ast")
-        ast = md(content)
-
-        def visit(node: dict) -> None:
-            ntype = node.get("type")
-
-            if ntype == "text":
-                text_widget.insert(tk.END, node.get("text", ""))
-                return
-
-            if ntype == "heading":
-                level = node.get("level", 1)
-                start = text_widget.index("end-1c")
-                for child in node.get("children", []):
-                    visit(child)
-                end = text_widget.index("end-1c")
-                tag = "h1" if level == 1 else "h2" if level == 2 else "h3"
-                text_widget.tag_add(tag, start, end)
-                text_widget.insert(tk.END, "\n")
-                return
-
-            if ntype == "paragraph":
-                start = text_widget.index("end-1c")
-                for child in node.get("children", []):
-                    visit(child)
-                end = text_widget.index("end-1c")
-                text_widget.insert(tk.END, "\n")
-                return
-
-            if ntype == "strong":
-                start = text_widget.index("end-1c")
-                for child in node.get("children", []):
-                    visit(child)
-                end = text_widget.index("end-1c")
-                text_widget.tag_add("bold", start, end)
-                return
-
-            if ntype == "emphasis":
-                start = text_widget.index("end-1c")
-                for child in node.get("children", []):
-                    visit(child)
-                end = text_widget.index("end-1c")
-                text_widget.tag_add("italic", start, end)
-                return
-
-            if ntype == "codespan":
-                start = text_widget.index("end-1c")
-                text_widget.insert(tk.END, node.get("text", ""))
-                end = text_widget.index("end-1c")
-                text_widget.tag_add("inlinecode", start, end)
-                return
-
-            if ntype == "code":
-                text_widget.insert(tk.END, node.get("text", "") + "\n", "codeblock")
-                return
-
-            if ntype == "link":
-                url = node.get("link") or node.get("href") or ""
-                start = text_widget.index("end-1c")
-                for child in node.get("children", []):
-                    visit(child)
-                end = text_widget.index("end-1c")
-                text_widget.tag_add("hyperlink", start, end)
-                insert_hyperlink(text_widget, start, end, url, link_callbacks)
-                return
-
-            if ntype == "image":
-                src = node.get("src") or node.get("url") or ""
-                # Resolve relative paths
-                img_path = src
-                if not os.path.isabs(img_path):
-                    img_path = os.path.join(base_folder, img_path)
-                img_path = os.path.abspath(img_path)
-
-                if os.path.exists(img_path):
-                    img = None
-                    try:
-                        img = tk.PhotoImage(file=img_path)
-                    except Exception:
-                        img = None
-                    if img is None and PIL_AVAILABLE:
-                        try:
-                            pil_img = Image.open(img_path)
-                            img = ImageTk.PhotoImage(pil_img)
-                        except Exception:
-                            img = None
-
-                    if img is not None:
-                        image_cache.append(img)
-                        text_widget.image_create(tk.END, image=img)
-                    else:
-                        text_widget.insert(tk.END, f"[Unsupported image format: {img_path}]\n")
-                else:
-                    text_widget.insert(tk.END, f"[Image not found: {img_path}]\n")
-                text_widget.insert(tk.END, "\n")
-                return
-
-            if ntype == "list":
-                for item in node.get("children", []):
-                    # list_item
-                    text_widget.insert(tk.END, "- ")
-                    for child in item.get("children", []):
-                        visit(child)
-                    text_widget.insert(tk.END, "\n")
-                return
-
-            # fallback: attempt to visit children
-            for child in node.get("children", []):
-                visit(child)
+        from PIL import Image, ImageTk
+    except ImportError:
+        return None
+    return Image, ImageTk
+
+
+def _decode_image(img_path: str) -> Any:
+    pil_img = _pil_modules()[0].open(img_path)
+    # thumbnail decodes straight at the reduced size where the format allows it
+    pil_img.thumbnail(_IMG_MAX_SIZE)
+    return pil_img
+
 
-        text_widget.config(state="normal")
-        text_widget.delete("1.0", tk.END)
-        for node in ast:
-            visit(node)
-        text_widget.config(state="disabled")
+def _place_decoded_image(
+    text_widget: tk.Text, mark: str, future: "Future[Any]", img_path: str, image_cache: ImageCache
+) -> None:
+    if not text_widget.winfo_exists():
+        return
+    if not future.done():
+        text_widget.after(_IMG_POLL_MS, _place_decoded_image, text_widget, mark, future, img_path, image_cache)
+        return
+    # the widget was refilled meanwhile, the placeholder went with its mark
+    if mark not in text_widget.mark_names():
         return
-    except Exception:
-        # fall back to the original renderer on error
-        pass
 
+    try:
+        img = _pil_modules()[1].PhotoImage(future.result())
+    except Exception:
+        img = None
 
-def render_markdown_raw(text_widget: tk.Text, content: str, image_cache: List[Any], base_folder: str) -> None:
-    # original simple renderer (fallback)
     text_widget.config(state="normal")
-    text_widget.delete("1.0", tk.END)
+    text_widget.delete(mark, f"{mark}+{len(_IMG_PLACEHOLDER)}c")
+    if img is not None:
+        image_cache[img_path] = (None, img)
+        text_widget.image_create(mark, image=img)
+    else:
+        text_widget.insert(mark, f"[Unsupported image format: {img_path}]\n")
+    text_widget.mark_unset(mark)
+    text_widget.config(state="disabled")
 
-    lines = content.split("\n")
-    in_code_block = False
 
-    for line in lines:
-        stripped = line.strip()
+def insert_image(
+    text_widget: tk.Text,
+    index: str,
+    img_path: str,
+    image_cache: ImageCache,
+    known_files: Optional[Set[str]] = None,
+) -> None:
+    # the same picture referenced again (in this or another tab) is decoded once
+    cached = image_cache.get(img_path)
+    if cached is not None:
+        text_widget.image_create(index, image=cached[1])
+        return
 
-        # fenced code block
-        if stripped.startswith("```"):
-            in_code_block = not in_code_block
-            text_widget.insert(tk.END, "\n", "codeblock")
-            continue
+    # files seen by the folder listing need no stat, anything else is checked on disk
+    if (known_files is None or img_path not in known_files) and not os.path.exists(img_path):
+        text_widget.insert(index, f"[Image not found: {img_path}]\n")
+        return
 
-        if in_code_block:
-            text_widget.insert(tk.END, line + "\n", "codeblock")
-            continue
+    # Tkinter PhotoImage (PNG/GIF), tried for anything else too when Pillow is missing
+    img = None
+    if img_path.lower().endswith(_TK_IMAGE_SUFFIXES) or _pil_modules() is None:
+        try:
+            img = tk.PhotoImage(file=img_path)
+        except Exception:
+            img = None
+
+    if img is not None:
+        image_cache[img_path] = (None, img)
+        text_widget.image_create(index, image=img)
+        return
+
+    # Decode with Pillow in the background, a placeholder keeps the spot;
+    # this also covers PNG/GIF variants Tk cannot read (16-bit, some interlaced files)
+    if _pil_modules() is not None:
+        mark = f"image_{next(_image_ids)}"
+        text_widget.mark_set(mark, index)
+        text_widget.mark_gravity(mark, "left")
+        text_widget.insert(index, _IMG_PLACEHOLDER)
+
+        future = _IMG_POOL.submit(_decode_image, img_path)
+        text_widget.after(_IMG_POLL_MS, _place_decoded_image, text_widget, mark, future, img_path, image_cache)
+        return
+
+    text_widget.insert(index, f"[Unsupported image format: {img_path}]\n")
+
+
+# ============================================================
+# Markdown Parsing
+# ============================================================
+class Document(NamedTuple):
+    """A parsed markdown file, independent of any widget.
+
+    ``segments`` alternates text and tags as taken by ``Text.insert``,
+    ``images`` holds ``(index, path)`` slots in document order and
+    ``links`` the target of each ``hyperlink_<n>`` tag.
+    """
+
+    segments: List[Any]
+    images: List[Tuple[str, str]]
+    links: List[str]
+
+
+# bump when the parsers change what they emit, so cached documents are rebuilt
+PARSER_VERSION = 3
+
+# heading markers, including the space, to their text tag
+_HEADINGS = {"# ": "h1", "## ": "h2", "### ": "h3"}
+
+
+class _TextEnd:
+    """Tracks the Tk "line.col" index of the end of a growing segment list.
+
+    append_segment only ever adds segments or extends the last text, so every
+    character is counted once, however many indices are asked for.
+    """
 
-        # ----------------------------------------------------
-        # Images: ![alt](path)
-        # ----------------------------------------------------
-        img_match = re.match(r"!\[.*?\]\((.*?)\)", stripped)
-        if img_match:
-            img_path = img_match.group(1)
-
-            # Resolve relative paths
-            if not os.path.isabs(img_path):
-                img_path = os.path.join(base_folder, img_path)
-
-            img_path = os.path.abspath(img_path)
-
-            if os.path.exists(img_path):
-                img = None
-
-                # Try Tkinter PhotoImage (PNG/GIF)
-                try:
-                    img = tk.PhotoImage(file=img_path)
-                except Exception:
-                    img = None
-
-                # Try Pillow for JPEG and others
-                if img is None and PIL_AVAILABLE:
-                    try:
-                        pil_img = Image.open(img_path)
-                        img = ImageTk.PhotoImage(pil_img)
-                    except Exception:
-                        img = None
-
-                if img is not None:
-                    image_cache.append(img)
-                    text_widget.image_create(tk.END, image=img)
-                else:
-                    text_widget.insert(tk.END, f"[Unsupported image format: {img_path}]\n")
+    def __init__(self) -> None:
+        self.line = 1
+        self.col = 0
+        # position in segments up to which the text is counted
+        self.seg = 0
+        self.pos = 0
+
+    def index(self, segments: List[Any]) -> str:
+        while self.seg < len(segments):
+            text = segments[self.seg]
+            newlines = text.count("\n", self.pos)
+            if newlines:
+                self.line += newlines
+                self.col = len(text) - (text.rfind("\n") + 1)
             else:
-                text_widget.insert(tk.END, f"[Image not found: {img_path}]\n")
+                self.col += len(text) - self.pos
+            # the last text may still grow, later calls resume inside it
+            if self.seg + 2 >= len(segments):
+                self.pos = len(text)
+                break
+            self.seg += 2
+            self.pos = 0
+        return f"{self.line}.{self.col}"
 
-            text_widget.insert(tk.END, "\n")
-            continue
 
-        # headings
-        if stripped.startswith("# "):
-            text_widget.insert(tk.END, stripped[2:] + "\n", "h1")
-            continue
-        if stripped.startswith("## "):
-            text_widget.insert(tk.END, stripped[3:] + "\n", "h2")
-            continue
-        if stripped.startswith("### "):
-            text_widget.insert(tk.END, stripped[4:] + "\n", "h3")
-            continue
+def _add_link(doc: Document, text: str, url: str, tags: Tuple[str, ...] = ()) -> Tuple[str, ...]:
+    tag_name = f"hyperlink_{len(doc.links)}"
+    doc.links.append(url)
+    link_tags = tags + ("hyperlink", tag_name)
+    if text:
+        append_segment(doc.segments, text, link_tags)
+    return link_tags
 
-        # ----------------------------------------------------
-        # Inline links: [text](url)
-        # ----------------------------------------------------
-        link_pattern = r"\[(.*?)\]\((.*?)\)"
-        pos = 0
-
-        for match in re.finditer(link_pattern, line):
-            start, end = match.span()
-            link_text, url = match.group(1), match.group(2)
-
-            # Insert text before the link
-            before = line[pos:start]
-            for ttype, text in tokenize_inline(before):
-                if ttype == TokenType.NORMAL:
-                    text_widget.insert(tk.END, text)
-                elif ttype == TokenType.ITALIC:
-                    text_widget.insert(tk.END, text, "italic")
-                elif ttype == TokenType.BOLD:
-                    text_widget.insert(tk.END, text, "bold")
-                elif ttype == TokenType.BOLD_ITALIC:
-                    text_widget.insert(tk.END, text, ("bold", "italic"))
-                elif ttype == TokenType.INLINE_CODE:
-                    text_widget.insert(tk.END, text, "inlinecode")
-
-            # Insert the link text
-            link_start = text_widget.index("end-1c")
-            text_widget.insert("end-1c", link_text, "hyperlink")
-            link_end = text_widget.index("end-1c")
-
-            insert_hyperlink(text_widget, link_start, link_end, url, callback_store=link_callbacks)
-
-            pos = end
-
-        # Insert remaining text after last link
-        remaining = line[pos:]
-        for ttype, text in tokenize_inline(remaining):
-            if ttype == TokenType.NORMAL:
-                text_widget.insert(tk.END, text)
-            elif ttype == TokenType.ITALIC:
-                text_widget.insert(tk.END, text, "italic")
-            elif ttype == TokenType.BOLD:
-                text_widget.insert(tk.END, text, "bold")
-            elif ttype == TokenType.BOLD_ITALIC:
-                text_widget.insert(tk.END, text, ("bold", "italic"))
-            elif ttype == TokenType.INLINE_CODE:
-                text_widget.insert(tk.END, text, "inlinecode")
-
-        text_widget.insert(tk.END, "\n")
-        continue
 
-    text_widget.config(state="disabled")
+def _resolve_image(src: str, base_folder: str) -> str:
+    # Resolve relative paths; absolute ones are kept, join drops base_folder for them.
+    # The result is absolute for an absolute base_folder and stays relative for ""
+    return os.path.normpath(os.path.join(base_folder, src))
+
+
+@lru_cache(maxsize=None)
+def _mistune_parser() -> Any:
+    # building the parser sets up mistune's rule registry, do it once per process
+    return mistune.create_markdown(renderer="ast")
+
 
+def parse_markdown_with_mistune(content: str, base_folder: str) -> Document:
+    # mistune does the parsing, the walk below only maps AST nodes to Tk tags
+    ast = _mistune_parser()(content)
+    doc = Document([], [], [])
+    text_end = _TextEnd()
+
+    def visit(node: dict, tags: Tuple[str, ...]) -> None:
+        ntype = node.get("type")
+
+        if ntype == "text":
+            append_segment(doc.segments, node.get("text", ""), tags)
+            return
+
+        if ntype == "heading":
+            level = node.get("level", 1)
+            tag = "h1" if level == 1 else "h2" if level == 2 else "h3"
+            for child in node.get("children", []):
+                visit(child, tags + (tag,))
+            append_segment(doc.segments, "\n", tags)
+            return
+
+        if ntype == "paragraph":
+            for child in node.get("children", []):
+                visit(child, tags)
+            append_segment(doc.segments, "\n", tags)
+            return
+
+        if ntype == "strong":
+            for child in node.get("children", []):
+                visit(child, tags + ("bold",))
+            return
 
-def render_markdown(text_widget: tk.Text, content: str, image_cache: List[Any], base_folder: str) -> None:
-    # If mistune is available, use the AST renderer for robust parsing
+        if ntype == "emphasis":
+            for child in node.get("children", []):
+                visit(child, tags + ("italic",))
+            return
+
+        if ntype == "codespan":
+            append_segment(doc.segments, node.get("text", ""), tags + ("inlinecode",))
+            return
+
+        if ntype == "code":
+            append_segment(doc.segments, node.get("text", "") + "\n", tags + ("codeblock",))
+            return
+
+        if ntype == "link":
+            url = node.get("link") or node.get("href") or ""
+            link_tags = _add_link(doc, "", url, tags)
+            for child in node.get("children", []):
+                visit(child, link_tags)
+            return
+
+        if ntype == "image":
+            src = node.get("src") or node.get("url") or ""
+            doc.images.append((text_end.index(doc.segments), _resolve_image(src, base_folder)))
+            append_segment(doc.segments, "\n", tags)
+            return
+
+        if ntype == "list":
+            for item in node.get("children", []):
+                # list_item
+                append_segment(doc.segments, "- ", tags)
+                for child in item.get("children", []):
+                    visit(child, tags)
+                append_segment(doc.segments, "\n", tags)
+            return
+
+        # fallback: attempt to visit children
+        for child in node.get("children", []):
+            visit(child, tags)
+
+    for node in ast:
+        visit(node, ())
+    return doc
+
+
+def _prose_lines(content: str, start: int, end: int, after_fence: bool, before_fence: bool) -> Iterator[str]:
+    # text between fences still carries the newlines that ended the fence lines
+    if after_fence:
+        if start == end:
+            return
+        start += 1
+    if before_fence:
+        if start == end:
+            return
+        end -= 1
+
+    # yield the lines one by one rather than materialising content.split("\n")
+    while True:
+        newline = content.find("\n", start, end)
+        if newline == -1:
+            yield content[start:end]
+            return
+        yield content[start:newline]
+        start = newline + 1
+
+
+def _parse_line(doc: Document, line: str, base_folder: str, text_end: _TextEnd) -> None:
+    segments = doc.segments
+    stripped = line.strip()
+
+    # ----------------------------------------------------
+    # Images: ![alt](path)
+    # ----------------------------------------------------
+    if stripped.startswith("!["):
+        close = stripped.find("](", 2)
+        end = stripped.find(")", close + 2) if close != -1 else -1
+        if end != -1:
+            # every rendered line ends with a newline, so the image starts a line
+            doc.images.append((text_end.index(segments), _resolve_image(stripped[close + 2 : end], base_folder)))
+            append_segment(segments, "\n")
+            return
+
+    # headings: one lookup on the marker up to the first space
+    if stripped[:1] == "#":
+        prefix = stripped[: stripped.find(" ", 1, 4) + 1]
+        tag = _HEADINGS.get(prefix)
+        if tag is not None:
+            append_segment(segments, stripped[len(prefix) :] + "\n", tag)
+            return
+
+    # plain prose: nothing to tokenize, skip the link and inline scans
+    if "*" not in line and "`" not in line and "](" not in line:
+        append_segment(segments, line + "\n")
+        return
+
+    # ----------------------------------------------------
+    # Inline links: [text](url)
+    # ----------------------------------------------------
+    pos = 0
+
+    for match in _LINK_RE.finditer(line):
+        start, end = match.span()
+        link_text, url = match.group(1), match.group(2)
+
+        # Insert text before the link
+        tokenize_inline(line, pos, start, segments)
+
+        # Insert the link text
+        _add_link(doc, link_text, url)
+
+        pos = end
+
+    # Insert remaining text after last link
+    tokenize_inline(line, pos, None, segments)
+
+    append_segment(segments, "\n")
+
+
+def parse_markdown_raw(content: str, base_folder: str) -> Document:
+    # original simple parser (fallback)
+    doc = Document([], [], [])
+    text_end = _TextEnd()
+    pos = 0
+
+    # fenced code blocks are cut out in one scan and inserted verbatim,
+    # only the prose between them goes through the line parser
+    for fence in _FENCE_RE.finditer(content):
+        for line in _prose_lines(content, pos, fence.start(), pos > 0, True):
+            _parse_line(doc, line, base_folder, text_end)
+        # an opening fence on the very last line, with no newline after it, has no body line
+        if "\n" in fence.group(0):
+            append_segment(doc.segments, "\n" + fence.group(1) + "\n", "codeblock")
+        else:
+            append_segment(doc.segments, "\n", "codeblock")
+        pos = fence.end()
+
+    for line in _prose_lines(content, pos, len(content), pos > 0, False):
+        _parse_line(doc, line, base_folder, text_end)
+
+    return doc
+
+
+def parse_markdown(content: str, base_folder: str) -> Document:
+    # If mistune is available, use the AST parser for robust parsing
     if MISTUNE_AVAILABLE:
-        render_markdown_with_mistune(text_widget, content, image_cache, base_folder)
+        try:
+            return parse_markdown_with_mistune(content, base_folder)
+        except Exception as e:
+            logging.debug(f"mistune failed, falling back to the raw parser: {e}")
+    # Fallback to the raw parser
+    return parse_markdown_raw(content, base_folder)
+
+
+# files from this size on are decoded straight from a memory map
+_MMAP_MIN_SIZE = 64 * 1024
+
+
+def read_text(path: str) -> str:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < _MMAP_MIN_SIZE:
+            text = f.read().decode("utf-8")
+        else:
+            # decoding the mapped pages skips the intermediate bytes copy
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                text = str(mm, "utf-8")
+
+    # same newline translation as reading in text mode
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+# least recently used cached documents are removed beyond this total size
+_DOC_CACHE_MAX_BYTES = 64 << 20
+
+
+def load_document(md_path: str, base_folder: str) -> Document:
+    """Parse ``md_path``, reusing the on-disk cache for content parsed before.
+
+    Cached documents are keyed by content and keep image paths relative to the
+    folder, so a file still hits after its folder moved or its archive was
+    extracted to a new temporary folder; the paths are resolved on every load.
+    """
+    text = read_text(md_path)
+    key = f"{hashlib.sha1(text.encode('utf-8')).hexdigest()}|{PARSER_VERSION}|{MISTUNE_AVAILABLE}"
+    cache_file = PATH_CACHE / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.pkl"
+
+    doc: Optional[Document] = None
+    try:
+        with open(cache_file, "rb") as f:
+            doc = pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.debug(f"Ignoring unreadable cache file {cache_file}: {e}")
+
+    if doc is not None:
+        # a hit counts as a use for prune_document_cache
+        try:
+            os.utime(cache_file)
+        except OSError:
+            pass
+    else:
+        doc = parse_markdown(text, "")
+
+        # write to a temporary name first so a concurrent reader never sees half a file
+        try:
+            with tempfile.NamedTemporaryFile(dir=PATH_CACHE, suffix=".tmp", delete=False) as f:
+                pickle.dump(doc, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f.name, cache_file)
+        except OSError as e:
+            logging.debug(f"Could not write cache file {cache_file}: {e}")
+
+    return doc._replace(images=[(index, _resolve_image(path, base_folder)) for index, path in doc.images])
+
+
+def prune_document_cache(max_bytes: int = _DOC_CACHE_MAX_BYTES) -> None:
+    """Remove the least recently used cached documents beyond ``max_bytes`` in total."""
+    try:
+        with os.scandir(PATH_CACHE) as entries:
+            files = [(e.stat().st_mtime_ns, e.stat().st_size, e.path) for e in entries if e.name.endswith(".pkl")]
+    except OSError as e:
+        logging.debug(f"Could not list the document cache: {e}")
         return
-    # Fallback to the raw renderer
-    render_markdown_raw(text_widget, content, image_cache, base_folder)
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+# ============================================================
+# Markdown Renderer
+# ============================================================
+def emit_document(
+    text_widget: tk.Text, doc: Document, image_cache: ImageCache, known_files: Optional[Set[str]] = None
+) -> None:
+    text_widget.config(state="normal")
+    # marks of decodes still in flight would survive the delete at 1.0, in the new text
+    for mark in text_widget.mark_names():
+        if mark.startswith("image_"):
+            text_widget.mark_unset(mark)
+    text_widget.delete("1.0", tk.END)
+
+    # the whole document goes in with one insert, then the images are placed
+    # back to front so earlier indices are not shifted by later insertions
+    if doc.segments:
+        text_widget.insert(tk.END, *doc.segments)
+    bind_hyperlinks(text_widget, doc.links)
+    for index, img_path in reversed(doc.images):
+        insert_image(text_widget, index, img_path, image_cache, known_files)
+
+    text_widget.config(state="disabled")
+
+
+def render_markdown(text_widget: tk.Text, content: str, image_cache: ImageCache, base_folder: str) -> None:
+    emit_document(text_widget, parse_markdown(content, base_folder), image_cache)
+
+
+# ============================================================
+# Styles
+# ============================================================
+# named fonts are created once per app and shared by every tab's tags,
+# so Tk resolves each font a single time instead of once per widget
+_MD_FONTS: Dict[str, Dict[str, Any]] = {
+    "md_h1": {"family": "DejaVu Sans", "size": 20, "weight": "bold"},
+    "md_h2": {"family": "DejaVu Sans", "size": 16, "weight": "bold"},
+    "md_h3": {"family": "DejaVu Sans", "size": 14, "weight": "bold"},
+    "md_bold": {"family": "DejaVu Sans", "size": 12, "weight": "bold"},
+    "md_italic": {"family": "DejaVu Sans", "size": 12, "slant": "italic"},
+    "md_bold_italic": {"family": "Arial", "size": 12, "weight": "bold", "slant": "italic"},
+    "md_code": {"family": "Courier", "size": 11},
+}
+
+_MD_TAGS: Dict[str, Dict[str, Any]] = {
+    "h1": {"font": "md_h1"},
+    "h2": {"font": "md_h2"},
+    "h3": {"font": "md_h3"},
+    "bold": {"font": "md_bold"},
+    "italic": {"font": "md_italic"},
+    "bold_italic": {"font": "md_bold_italic"},
+    "inlinecode": {"font": "md_code", "background": "#707070", "foreground": "#90ee90"},
+    "codeblock": {"font": "md_code", "background": "#707070", "foreground": "#90ee90"},
+    "hyperlink": {"foreground": "blue", "underline": True},
+}
+
+
+def create_md_fonts(root: tk.Tk) -> List[tkfont.Font]:
+    # the caller keeps the returned objects alive, Tk drops a named font
+    # once its Python wrapper is garbage collected
+    return [tkfont.Font(root=root, name=name, **options) for name, options in _MD_FONTS.items()]
+
+
+def apply_md_tags(text_widget: tk.Text) -> None:
+    for tag, options in _MD_TAGS.items():
+        text_widget.tag_config(tag, **options)
 
 
 # ============================================================
 # Main Application
 # ============================================================
+# how often a selected tab checks whether its document has finished loading
+_LOAD_POLL_MS = 20
+# below this many bytes to read, starting worker processes costs more than parsing in a thread
+_INLINE_LOAD_BYTES = 1 << 20
+# file times can be coarse (2 s on FAT) or trail the wall clock, anything this close to a listing counts as newer
+_MTIME_SLACK_NS = 2_000_000_000
+
+
 class MarkdownViewerApp:
     def __init__(self, root: tk.Tk, folder: str) -> None:
         self.root: tk.Tk = root
         self.folder: str = os.path.abspath(os.path.expanduser(folder))
-        self.image_cache: List[Any] = []
+        self.image_cache: ImageCache = {}
+        # every file below the folder, filled by the listing in load_markdown_files,
+        # with the time that listing started
+        self._known_files: Set[str] = set()
+        self._listed_at = 0
+        # tabs that are added but not rendered yet, keyed by notebook tab id,
+        # with the files being loaded in the background
+        self._pending_tabs: Dict[str, "Future[Document]"] = {}
+        # the load each selected tab is waiting for, a reload meanwhile replaces it
+        self._loading: Dict[str, "Future[Document]"] = {}
+        # the tab of every listed file with the mtime it was loaded at,
+        # and the Text widget of each tab rendered so far
+        self._tabs: Dict[str, ttk.Frame] = {}
+        self._mtimes: Dict[str, int] = {}
+        self._text_widgets: Dict[str, tk.Text] = {}
+        # parsing is pure Python, worker processes keep large folders off the GIL the Tk loop needs;
+        # they start on first use, small folders are parsed by a single thread
+        self._read_pool: Optional[ProcessPoolExecutor] = None
+        self._read_thread = ThreadPoolExecutor(max_workers=1)
+        # trimming the document cache only touches files, keep it off the startup path
+        threading.Thread(target=prune_document_cache, daemon=True).start()
 
         abs_target_path = os.path.join(os.getcwd(), folder)
         root.title(f"Markdown Viewer -- {abs_target_path}")
         root.minsize(1366, 768)
 
+        self._fonts = create_md_fonts(root)
+
         style = ttk.Style()
         style.theme_use("clam")
         style.configure("righttab.TNotebook", tabposition="en")
@@ -400,6 +733,13 @@ class MarkdownViewerApp:
             label="Save to file",
             command=lambda: pack_folder(self.folder, str(PATH_STORAGE / (flatten_path(self.folder) + ".mdlz"))),
         )
+        if ZSTD_AVAILABLE:
+            file_menu.add_command(
+                label="Save to file (zstd)",
+                command=lambda: pack_folder_zstd(
+                    self.folder, str(PATH_STORAGE / (flatten_path(self.folder) + ".mdlz"))
+                ),
+            )
         file_menu.add_command(
             label="Save to folder",
             command=self.save_to_folder,
@@ -413,63 +753,204 @@ class MarkdownViewerApp:
             command=lambda: self.load_markdown_files(),
         )
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=root.quit)
+        file_menu.add_command(label="Exit", command=self.close)
         menubar.add_cascade(label="File", menu=file_menu)
         self.root.config(menu=menubar)
 
         self.notebook = ttk.Notebook(root, style="righttab.TNotebook")
         self.notebook.pack(fill="both", expand=True)
+        self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+        root.protocol("WM_DELETE_WINDOW", self.close)
 
         self.load_markdown_files()
 
+    def close(self) -> None:
+        """Stop the background loads and close the window."""
+        self._read_thread.shutdown(cancel_futures=True)
+        if self._read_pool is not None:
+            self._read_pool.shutdown(cancel_futures=True)
+        self.root.quit()
+
     def save_to_folder(self) -> None:
         """Open a dialog to select a directory and copy the current folder to it."""
         target_dir = filedialog.askdirectory(title="Select destination folder")
-        if target_dir:
-            try:
-                shutil.copytree(self.folder, target_dir, dirs_exist_ok=True)
-                logging.info(f"Successfully copied {self.folder} to {target_dir}")
-            except Exception as e:
-                logging.error(f"Error copying folder: {e}")
-
-        self.folder = target_dir
+        if not target_dir:
+            return
+        try:
+            # the copy is a folder of its own, not an extracted archive
+            shutil.copytree(
+                self.folder, target_dir, ignore=shutil.ignore_patterns(PACKED_SOURCE_MARKER), dirs_exist_ok=True
+            )
+            logging.info(f"Successfully copied {self.folder} to {target_dir}")
+        except Exception as e:
+            logging.error(f"Error copying folder: {e}")
+            return
+
+        self.rebase_folder(target_dir)
         add_folder_to_library(self.folder)
 
+    def rebase_folder(self, new_folder: str) -> None:
+        """Point the app at a copy of its folder without re-reading any file.
+
+        The tabs, their rendered content and the known mtimes carry over, as
+        copytree keeps modification times; a later reload only picks up files
+        that really differ in the new folder.
+        """
+        old_folder = self.folder
+        new_folder = os.path.abspath(os.path.expanduser(new_folder))
+
+        def rebase(path: str) -> str:
+            return os.path.join(new_folder, os.path.relpath(path, old_folder))
+
+        self._tabs = {rebase(p): tab for p, tab in self._tabs.items()}
+        self._mtimes = {rebase(p): mtime for p, mtime in self._mtimes.items()}
+        self._known_files = {rebase(f) for f in self._known_files}
+        self.folder = new_folder
+        self.root.title(f"Markdown Viewer -- {new_folder}")
+
     def normalize_path(self, path: str) -> str:
         rel: str = os.path.relpath(path, self.folder)
         return rel.replace(os.sep, "/")
 
     def load_markdown_files(self) -> None:
-        md_files = list_all_files_with_ext(self.folder, "md")
-
-        for md_path in md_files:
-            tab = ttk.Frame(self.notebook)
-            label = self.normalize_path(md_path)
-            self.notebook.add(tab, text=label)
-
-            # container frame for text + scrollbar
-            frame = ttk.Frame(tab)
-            frame.pack(fill="both", expand=True)
-
-            text_widget = tk.Text(frame, wrap="word")
-            text_widget.pack(side="left", fill="both", expand=True)
-
-            scrollbar = ttk.Scrollbar(frame, command=text_widget.yview)
-            scrollbar.pack(side="right", fill="y")
-            text_widget.configure(yscrollcommand=scrollbar.set)
-
-            # fonts
-            text_widget.tag_config("h1", font=("DejaVu Sans", 20, "bold"))
-            text_widget.tag_config("h2", font=("DejaVu Sans", 16, "bold"))
-            text_widget.tag_config("h3", font=("DejaVu Sans", 14, "bold"))
-            text_widget.tag_config("bold", font=("DejaVu Sans", 12, "bold"))
-            text_widget.tag_config("italic", font=("DejaVu Sans", 12, "italic"))
-            text_widget.tag_config("bold_italic", font=("Arial", 12, "bold", "italic"))
-            text_widget.tag_config("inlinecode", font=("Courier", 11), background="#707070", foreground="#90ee90")
-            text_widget.tag_config("codeblock", font=("Courier", 11), background="#707070", foreground="#90ee90")
-            text_widget.tag_config("hyperlink", foreground="blue", underline=True)
-
-            with open(md_path, "r", encoding="utf-8") as f:
-                content = f.read()
-
-            render_markdown(text_widget, content, self.image_cache, self.folder)
+        # one walk answers both which tabs to add and which images exist
+        listed_at = time.time_ns()
+        self._known_files = list_all_files(self.folder)
+        # plain path strings, sorted by their components the way Path objects sort
+        md_files = sorted((f for f in self._known_files if f.endswith(".md")), key=lambda f: f.split(os.sep))
+
+        # on reload, drop the tabs of files that are gone
+        for md_path in set(self._tabs) - set(md_files):
+            tab = self._tabs.pop(md_path)
+            self._mtimes.pop(md_path, None)
+            self._pending_tabs.pop(str(tab), None)
+            self._loading.pop(str(tab), None)
+            self._text_widgets.pop(str(tab), None)
+            self.notebook.forget(tab)
+            tab.destroy()
+
+        # pictures edited or removed since they were decoded are read again,
+        # and the rendered tabs are filled anew as any of them may show one
+        if self._drop_changed_images(self._listed_at):
+            for md_path, tab in self._tabs.items():
+                if str(tab) in self._text_widgets:
+                    self._mtimes.pop(md_path, None)
+        self._listed_at = listed_at
+
+        # only create the tabs here, the content is rendered on first selection;
+        # documents are read and parsed in parallel by the worker processes,
+        # and on reload only files changed since the last load are read again
+        to_load: List[Tuple[int, str, ttk.Frame]] = []
+        load_bytes = 0
+        for position, md_path in enumerate(md_files):
+            try:
+                stat = os.stat(md_path)
+            except OSError:
+                continue
+
+            tab = self._tabs.get(md_path)
+            if tab is None:
+                tab = ttk.Frame(self.notebook)
+                label = self.normalize_path(md_path)
+                self.notebook.insert(position if position < len(self.notebook.tabs()) else "end", tab, text=label)
+                self._tabs[md_path] = tab
+            elif self._mtimes.get(md_path) == stat.st_mtime_ns:
+                continue
+
+            self._mtimes[md_path] = stat.st_mtime_ns
+            to_load.append((stat.st_ino, md_path, tab))
+            load_bytes += stat.st_size
+
+        if load_bytes <= _INLINE_LOAD_BYTES:
+            executor: Executor = self._read_thread
+        else:
+            if self._read_pool is None:
+                # spawn keeps the children free of the parent's Tk state
+                self._read_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+            executor = self._read_pool
+
+        # queue the reads in inode order, close to on-disk order on POSIX
+        # filesystems; Windows reports no meaningful inode, keep name order there
+        if os.name != "nt":
+            to_load.sort(key=lambda item: item[0])
+        # the selected tab is shown right away, it goes first and never waits for the workers to start
+        selected = self.notebook.select()
+        to_load.sort(key=lambda item: str(item[2]) != selected)
+        for _, md_path, tab in to_load:
+            submit = self._read_thread.submit if str(tab) == selected else executor.submit
+            self._pending_tabs[str(tab)] = submit(load_document, md_path, self.folder)
+
+        # no tab change event comes for a selected tab that was reloaded
+        self._on_tab_changed(None)
+
+    def _drop_changed_images(self, since: int) -> bool:
+        # A picture without a recorded mtime was decoded after the listing that started at `since`.
+        # If its file is older than that listing, the decode saw the current content
+        changed = False
+        for img_path, (mtime, img) in list(self.image_cache.items()):
+            try:
+                current = os.stat(img_path).st_mtime_ns
+            except OSError:
+                current = None
+            if current is not None and (current == mtime or mtime is None and current < since - _MTIME_SLACK_NS):
+                self.image_cache[img_path] = (current, img)
+                continue
+            del self.image_cache[img_path]
+            changed = True
+        return changed
+
+    def _on_tab_changed(self, event: Any) -> None:
+        _ = event  # keep reference to satisfy callback signature
+        tab_id = self.notebook.select()
+        pending = self._pending_tabs.pop(tab_id, None)
+        if pending is not None:
+            self._loading[tab_id] = pending
+            self._render_when_loaded(self.notebook.nametowidget(tab_id), pending)
+
+    def _render_when_loaded(self, tab: ttk.Frame, pending: "Future[Document]") -> None:
+        # wait for the worker without blocking the event loop, the tab stays empty until then
+        if not tab.winfo_exists():
+            return
+        # a reload started a newer load for this tab, only that one renders
+        if self._loading.get(str(tab)) is not pending:
+            return
+        if not pending.done():
+            self.root.after(_LOAD_POLL_MS, self._render_when_loaded, tab, pending)
+            return
+        del self._loading[str(tab)]
+
+        try:
+            doc = pending.result()
+        except Exception as e:
+            # the tab tells why it is empty, and forgetting the mtime lets a reload try again
+            md_path = next((path for path, t in self._tabs.items() if t is tab), "")
+            self._mtimes.pop(md_path, None)
+            logging.error(f"Error loading {md_path}: {e}")
+            doc = Document([f"[Could not load {md_path}: {e}]\n", NORMAL], [], [])
+
+        text_widget = self._text_widgets.get(str(tab))
+        if text_widget is None:
+            self.render_tab(tab, doc)
+            return
+
+        # a changed file refills its existing widget and keeps the reading position
+        top = text_widget.yview()[0]
+        emit_document(text_widget, doc, self.image_cache, self._known_files)
+        text_widget.yview_moveto(top)
+
+    def render_tab(self, tab: ttk.Frame, doc: Document) -> None:
+        # container frame for text + scrollbar
+        frame = ttk.Frame(tab)
+        frame.pack(fill="both", expand=True)
+
+        text_widget = tk.Text(frame, wrap="word")
+        text_widget.pack(side="left", fill="both", expand=True)
+
+        scrollbar = ttk.Scrollbar(frame, command=text_widget.yview)
+        scrollbar.pack(side="right", fill="y")
+        text_widget.configure(yscrollcommand=scrollbar.set)
+
+        apply_md_tags(text_widget)
+
+        emit_document(text_widget, doc, self.image_cache, self._known_files)
+        self._text_widgets[str(tab)] = text_widget
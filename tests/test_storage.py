@@ -1,4 +1,5 @@
 import json
+import os
 import shutil
 import sys
 import zipfile
@@ -59,6 +60,20 @@ def test_flatten_path_relative(relative_path):
         flatten_path(relative_path)
 
 
+@pytest.mark.parametrize(
+    "file_path, expected",
+    [
+        ("/data/notes.mdlz", True),
+        ("C:\\data\\NOTES.MDLZ", True),
+        ("/data/notes.md", False),
+        ("/data/notesmdlz", False),
+        ("/data.mdlz/notes", False),
+    ],
+)
+def test_is_mdlz_file(file_path, expected):
+    assert storage.is_mdlz_file(file_path) is expected
+
+
 def test_list_mdlz_files_respects_path_storage(tmp_path, monkeypatch):
     fake_storage = tmp_path / "storage"
     fake_storage.mkdir()
@@ -77,6 +92,30 @@ def test_list_mdlz_files_respects_path_storage(tmp_path, monkeypatch):
     assert "three.txt" not in names
 
 
+def test_list_mdlz_files(tmp_path, monkeypatch):
+    fake_storage = tmp_path / "storage"
+    _create_files(fake_storage, ["b.mdlz", "a.mdlz", "c.MDLZ", "d.txt", ".cache/e.mdlz"])
+    monkeypatch.setattr(storage, "PATH_STORAGE", fake_storage)
+
+    assert storage.list_mdlz_files() == [fake_storage / "a.mdlz", fake_storage / "b.mdlz"]
+
+
+def test_list_mdlz_files_is_rescanned_only_after_folder_change(tmp_path, monkeypatch):
+    fake_storage = tmp_path / "storage"
+    _create_files(fake_storage, ["a.mdlz"])
+    monkeypatch.setattr(storage, "PATH_STORAGE", fake_storage)
+    assert storage.list_mdlz_files() == [fake_storage / "a.mdlz"]
+
+    with monkeypatch.context() as m:
+        m.setattr(storage.os, "scandir", lambda *args: pytest.fail("rescanned"))
+        assert storage.list_mdlz_files() == [fake_storage / "a.mdlz"]
+
+    (fake_storage / "b.mdlz").write_text("x")
+    # coarse file system timestamps may not move within the test
+    os.utime(fake_storage, ns=(0, os.stat(fake_storage).st_mtime_ns + 1))
+    assert storage.list_mdlz_files() == [fake_storage / "a.mdlz", fake_storage / "b.mdlz"]
+
+
 def test_pack_and_unpack_folder(tmp_path):
     # create a folder with nested files
     src_folder = tmp_path / "orig"
@@ -104,6 +143,114 @@ def test_pack_and_unpack_folder(tmp_path):
     assert (extract_to / "subdir" / "b.md").read_text() == "world"
 
 
+def test_pack_folder_stores_small_and_precompressed_files(tmp_path):
+    src_folder = tmp_path / "orig"
+    src_folder.mkdir()
+    (src_folder / "small.md").write_text("tiny")
+    (src_folder / "large.md").write_text("text " * storage.STORE_BELOW_SIZE)
+    (src_folder / "large.PNG").write_text("text " * storage.STORE_BELOW_SIZE)
+
+    zip_path = tmp_path / "out.mdlz"
+    storage.pack_folder(str(src_folder), str(zip_path))
+
+    with zipfile.ZipFile(str(zip_path), "r") as zf:
+        assert zf.getinfo("small.md").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("large.md").compress_type == zipfile.ZIP_DEFLATED
+        assert zf.getinfo("large.PNG").compress_type == zipfile.ZIP_STORED
+
+
+@pytest.mark.parametrize("prefetch_below", [0, 1 << 20])
+def test_pack_folder_round_trips_streamed_and_prefetched_files(tmp_path, monkeypatch, prefetch_below):
+    monkeypatch.setattr(storage, "PREFETCH_BELOW_SIZE", prefetch_below)
+    src_folder = tmp_path / "orig"
+    names = [f"d{i % 3}/f{i}.md" for i in range(20)]
+    _create_files(src_folder, names)
+    (src_folder / "big.md").write_text("line\n" * storage.STORE_BELOW_SIZE)
+    (src_folder / "big.png").write_text("line\n" * storage.STORE_BELOW_SIZE)
+
+    zip_path = tmp_path / "out.mdlz"
+    storage.pack_folder(str(src_folder), str(zip_path))
+    with zipfile.ZipFile(str(zip_path), "r") as zf:
+        assert zf.testzip() is None
+    extract_to = tmp_path / "extracted"
+    storage.unpack_file(str(zip_path), str(extract_to))
+
+    for name in names + ["big.md", "big.png"]:
+        assert (extract_to / name).read_text() == (src_folder / name).read_text()
+
+
+@pytest.mark.parametrize("prefetch_below", [0, 1 << 20])
+def test_pack_folder_accepts_files_older_than_zip_timestamps(tmp_path, monkeypatch, prefetch_below):
+    monkeypatch.setattr(storage, "PREFETCH_BELOW_SIZE", prefetch_below)
+    src_folder = tmp_path / "orig"
+    _create_files(src_folder, ["old.md", "old.png"])
+    (src_folder / "old.md").write_text("text " * storage.STORE_BELOW_SIZE)
+    for name in ["old.md", "old.png"]:
+        os.utime(src_folder / name, (0, 0))
+
+    zip_path = tmp_path / "out.mdlz"
+    storage.pack_folder(str(src_folder), str(zip_path))
+
+    with zipfile.ZipFile(str(zip_path), "r") as zf:
+        assert zf.getinfo("old.md").date_time == (1980, 1, 1, 0, 0, 0)
+
+
+def test_pack_folder_includes_hidden_files(tmp_path):
+    src_folder = tmp_path / "orig"
+    _create_files(src_folder, ["a.md", ".hidden/b.png"])
+
+    zip_path = tmp_path / "out.mdlz"
+    storage.pack_folder(str(src_folder), str(zip_path))
+
+    with zipfile.ZipFile(str(zip_path), "r") as zf:
+        assert sorted(zf.namelist()) == [".hidden/b.png", "a.md"]
+
+
+def test_pack_folder_zstd_round_trips(tmp_path):
+    pytest.importorskip("zstandard")
+    src_folder = tmp_path / "orig"
+    _create_files(src_folder, ["a.md", "sub/b.md", ".hidden/c.png"])
+
+    zip_path = tmp_path / "out.mdlz"
+    storage.pack_folder_zstd(str(src_folder), str(zip_path))
+    assert zip_path.read_bytes().startswith(storage.ZSTD_MAGIC)
+
+    extract_to = tmp_path / "extracted"
+    storage.unpack_file(str(zip_path), str(extract_to))
+    for name in ["a.md", "sub/b.md", ".hidden/c.png"]:
+        assert (extract_to / name).read_text() == "content"
+
+
+def test_unpack_file_keeps_members_inside_target(tmp_path):
+    zip_path = tmp_path / "evil.mdlz"
+    with zipfile.ZipFile(str(zip_path), "w") as zf:
+        zf.writestr("../escape.md", "out")
+        zf.writestr("/abs/x.md", "abs")
+        zf.writestr("empty/", "")
+
+    extract_to = tmp_path / "extracted"
+    storage.unpack_file(str(zip_path), str(extract_to))
+
+    assert not (tmp_path / "escape.md").exists()
+    assert (extract_to / "escape.md").read_text() == "out"
+    assert (extract_to / "abs" / "x.md").read_text() == "abs"
+    assert (extract_to / "empty").is_dir()
+
+
+@pytest.mark.parametrize("mmap_below", [0, 512 << 20])
+def test_unpack_file_with_and_without_mmap(tmp_path, monkeypatch, mmap_below):
+    monkeypatch.setattr(storage, "MMAP_BELOW_SIZE", mmap_below)
+    zip_path = tmp_path / "z.mdlz"
+    with zipfile.ZipFile(str(zip_path), "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(20):
+            zf.writestr(f"d{i % 3}/f{i}.md", f"content {i}" * 100)
+
+    extract_to = tmp_path / "extracted"
+    storage.unpack_file(str(zip_path), str(extract_to))
+    for i in range(20):
+        assert (extract_to / f"d{i % 3}" / f"f{i}.md").read_text() == f"content {i}" * 100
+
+
 def test_unpack_file_to_temp_and_cleanup(tmp_path):
     # create a small zip to test unpack_file_to_temp
     src_folder = tmp_path / "s"
@@ -122,6 +269,100 @@ def test_unpack_file_to_temp_and_cleanup(tmp_path):
         shutil.rmtree(tempdir, ignore_errors=True)
 
 
+def test_pack_folder_copies_unchanged_temp_folder(tmp_path):
+    src_folder = tmp_path / "s"
+    _create_files(src_folder, ["a.md", "sub/b.md"])
+    (src_folder / "a.md").write_text("text " * storage.STORE_BELOW_SIZE)
+    zip_path = tmp_path / "z.mdlz"
+    storage.pack_folder(str(src_folder), str(zip_path))
+
+    tempdir = storage.unpack_file_to_temp(str(zip_path))
+    try:
+        assert (Path(tempdir) / storage.PACKED_SOURCE_MARKER).exists()
+        copy_path = tmp_path / "copy.mdlz"
+        # a different compression method would show if the folder was packed again
+        storage.pack_folder(tempdir, str(copy_path), compression=zipfile.ZIP_STORED)
+        assert copy_path.read_bytes() == zip_path.read_bytes()
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+def test_pack_folder_zstd_copies_unchanged_temp_folder(tmp_path):
+    pytest.importorskip("zstandard")
+    src_folder = tmp_path / "s"
+    _create_files(src_folder, ["a.md", "sub/b.md"])
+    zip_path = tmp_path / "z.mdlz"
+    storage.pack_folder_zstd(str(src_folder), str(zip_path), level=19)
+
+    tempdir = storage.unpack_file_to_temp(str(zip_path))
+    try:
+        copy_path = tmp_path / "copy.mdlz"
+        storage.pack_folder_zstd(tempdir, str(copy_path), level=1)
+        assert copy_path.read_bytes() == zip_path.read_bytes()
+
+        # a zip is written from scratch, without the marker
+        zip_copy_path = tmp_path / "copy_zip.mdlz"
+        storage.pack_folder(tempdir, str(zip_copy_path))
+        with zipfile.ZipFile(str(zip_copy_path), "r") as zf:
+            assert sorted(zf.namelist()) == ["a.md", "sub/b.md"]
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+@pytest.mark.parametrize("change", ["edit", "add", "remove", "rename"])
+def test_pack_folder_repacks_changed_temp_folder(tmp_path, change):
+    src_folder = tmp_path / "s"
+    _create_files(src_folder, ["a.md", "sub/b.md"])
+    zip_path = tmp_path / "z.mdlz"
+    storage.pack_folder(str(src_folder), str(zip_path))
+
+    tempdir = Path(storage.unpack_file_to_temp(str(zip_path)))
+    try:
+        marker_mtime = os.stat(tempdir / storage.PACKED_SOURCE_MARKER).st_mtime_ns
+        if change == "edit":
+            (tempdir / "sub" / "b.md").write_text("edited")
+        elif change == "add":
+            (tempdir / "sub" / "c.md").write_text("new")
+        elif change == "remove":
+            (tempdir / "sub" / "b.md").unlink()
+        else:
+            (tempdir / "a.md").rename(tempdir / "z.md")
+        # coarse file system timestamps may not move within the test
+        for path in [tempdir, tempdir / "sub"] + list(tempdir.glob("sub/*.md")):
+            os.utime(path, ns=(0, max(os.stat(path).st_mtime_ns, marker_mtime + 1)))
+
+        copy_path = tmp_path / "copy.mdlz"
+        storage.pack_folder(str(tempdir), str(copy_path))
+        with zipfile.ZipFile(str(copy_path), "r") as zf:
+            names = set(zf.namelist())
+        assert storage.PACKED_SOURCE_MARKER not in names
+        assert names == {p.relative_to(tempdir).as_posix() for p in tempdir.rglob("*.md")}
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+def test_pack_folder_repacks_temp_folder_edited_with_old_mtimes(tmp_path):
+    src_folder = tmp_path / "s"
+    _create_files(src_folder, ["a.md"])
+    zip_path = tmp_path / "z.mdlz"
+    storage.pack_folder(str(src_folder), str(zip_path))
+
+    tempdir = Path(storage.unpack_file_to_temp(str(zip_path)))
+    try:
+        # like cp -p or rsync -t, the edit keeps the earlier timestamps
+        times = {path: os.stat(path).st_mtime_ns for path in [tempdir, tempdir / "a.md"]}
+        (tempdir / "a.md").write_text("edited content")
+        for path, mtime in times.items():
+            os.utime(path, ns=(mtime, mtime))
+
+        copy_path = tmp_path / "copy.mdlz"
+        storage.pack_folder(str(tempdir), str(copy_path))
+        with zipfile.ZipFile(str(copy_path), "r") as zf:
+            assert zf.read("a.md") == b"edited content"
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
 def test_load_library_data_and_add_folder(tmp_path, monkeypatch):
     fake_lib = tmp_path / "library.json"
 
@@ -170,6 +411,81 @@ def test_list_all_files_with_ext(tmp_path):
     assert result_strs == expected
 
 
+def test_list_all_files_with_ext_skips_hidden_entries(tmp_path):
+    base = tmp_path / "folder"
+    base.mkdir()
+
+    _create_files(base, ["a.md", ".hidden.md", ".git/b.md", "sub/c.md"])
+
+    result = list_all_files_with_ext(base, "md")
+
+    assert result == [base / "a.md", base / "sub" / "c.md"]
+
+
+def test_list_all_files(tmp_path):
+    base = tmp_path / "folder"
+    base.mkdir()
+
+    _create_files(base, ["a.md", "img/b.png", ".git/c.md"])
+
+    assert storage.list_all_files(base) == {str(base / "a.md"), str(base / "img" / "b.png")}
+
+
+def _symlink_dir(link: Path, target: Path) -> None:
+    try:
+        os.symlink(target, link, target_is_directory=True)
+    except (OSError, NotImplementedError):
+        pytest.skip("symlinks are not supported here")
+
+
+def test_listing_follows_symlinked_folders_once(tmp_path):
+    outside = tmp_path / "outside"
+    _create_files(outside, ["a.md"])
+    base = tmp_path / "folder"
+    _create_files(base, ["b.md"])
+    _symlink_dir(base / "linked", outside)
+    # a link back to an ancestor must not loop forever
+    _symlink_dir(outside / "back", base)
+
+    expected = {str(base / "b.md"), str(base / "linked" / "a.md")}
+    assert storage.list_all_files(base) == expected
+    assert {str(p) for p in storage.list_all_files_with_ext(base, "md")} == expected
+
+
+def test_pack_folder_does_not_follow_symlinked_folders(tmp_path):
+    outside = tmp_path / "outside"
+    _create_files(outside, ["a.md"])
+    src_folder = tmp_path / "orig"
+    _create_files(src_folder, ["b.md"])
+    _symlink_dir(src_folder / "linked", outside)
+
+    zip_path = tmp_path / "out.mdlz"
+    storage.pack_folder(str(src_folder), str(zip_path))
+
+    with zipfile.ZipFile(str(zip_path), "r") as zf:
+        assert zf.namelist() == ["b.md"]
+
+
+@pytest.mark.parametrize("zstd", [False, True])
+def test_pack_folder_stores_symlinked_file_content(tmp_path, zstd):
+    if zstd:
+        pytest.importorskip("zstandard")
+    src_folder = tmp_path / "orig"
+    _create_files(src_folder, ["a.md"])
+    try:
+        os.symlink(src_folder / "a.md", src_folder / "link.md")
+    except (OSError, NotImplementedError):
+        pytest.skip("symlinks are not supported here")
+
+    zip_path = tmp_path / "out.mdlz"
+    (storage.pack_folder_zstd if zstd else storage.pack_folder)(str(src_folder), str(zip_path))
+
+    extract_to = tmp_path / "extracted"
+    storage.unpack_file(str(zip_path), str(extract_to))
+    assert (extract_to / "link.md").read_text() == "content"
+    assert not (extract_to / "link.md").is_symlink()
+
+
 def test_gen_init_index_json_writes_entries(tmp_path):
     base = tmp_path / "folder2"
     base.mkdir()
@@ -197,6 +513,86 @@ def test_gen_init_index_json_rejects_relative_path(tmp_path):
         gen_init_index_json(rel)
 
 
+@pytest.mark.parametrize("use_orjson", [False, True])
+def test_library_data_is_read_once_and_written_atomically(tmp_path, monkeypatch, use_orjson):
+    if use_orjson and not storage.ORJSON_AVAILABLE:
+        pytest.skip("orjson not installed")
+    monkeypatch.setattr(storage, "ORJSON_AVAILABLE", use_orjson)
+    fake_lib = tmp_path / "library.json"
+    fake_lib.write_text(json.dumps({"folders": ["/a"]}), encoding="utf-8")
+    monkeypatch.setattr(storage, "PATH_LIBRARY", fake_lib)
+
+    assert storage.load_library_data() == {"folders": ["/a"]}
+
+    # later loads are served from memory
+    if use_orjson:
+        monkeypatch.setattr(storage.orjson, "loads", lambda *args: pytest.fail("read twice"))
+    else:
+        monkeypatch.setattr(storage.json, "load", lambda *args: pytest.fail("read twice"))
+    storage.add_folder_to_library("/b")
+    assert storage.load_library_data() == {"folders": ["/a", "/b"]}
+
+    # the same layout with either reader installed
+    assert fake_lib.read_text(encoding="utf-8") == json.dumps({"folders": ["/a", "/b"]}, indent=4)
+    assert [p.name for p in tmp_path.iterdir()] == ["library.json"]
+
+
+def test_library_data_is_reread_after_external_change(tmp_path, monkeypatch):
+    fake_lib = tmp_path / "library.json"
+    fake_lib.write_text(json.dumps({"folders": ["/a"]}), encoding="utf-8")
+    monkeypatch.setattr(storage, "PATH_LIBRARY", fake_lib)
+    assert storage.load_library_data() == {"folders": ["/a"]}
+
+    # another process rewrites the library
+    fake_lib.write_text(json.dumps({"folders": ["/a", "/other"]}), encoding="utf-8")
+
+    assert storage.load_library_data() == {"folders": ["/a", "/other"]}
+
+
+def test_load_library_data_returns_a_copy(tmp_path, monkeypatch):
+    fake_lib = tmp_path / "library.json"
+    fake_lib.write_text(json.dumps({"folders": ["/a"]}), encoding="utf-8")
+    monkeypatch.setattr(storage, "PATH_LIBRARY", fake_lib)
+
+    storage.load_library_data()["folders"].append("/changed")
+
+    assert storage.load_library_data() == {"folders": ["/a"]}
+
+
+def test_failed_library_write_leaves_cache_and_folder_untouched(tmp_path, monkeypatch):
+    fake_lib = tmp_path / "library.json"
+    fake_lib.write_text(json.dumps({"folders": ["/a"]}), encoding="utf-8")
+    monkeypatch.setattr(storage, "PATH_LIBRARY", fake_lib)
+    storage.load_library_data()
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(storage.os, "replace", fail)
+        with pytest.raises(OSError):
+            storage.add_folder_to_library("/b")
+
+    assert storage.load_library_data() == {"folders": ["/a"]}
+    assert [p.name for p in tmp_path.iterdir()] == ["library.json"]
+
+    # a retry adds the folder once
+    storage.add_folder_to_library("/b")
+    assert json.loads(fake_lib.read_text(encoding="utf-8")) == {"folders": ["/a", "/b"]}
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX permissions")
+def test_library_file_mode_follows_umask(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "PATH_LIBRARY", tmp_path / "library.json")
+    old_umask = os.umask(0o022)
+    try:
+        storage.add_folder_to_library("/a")
+    finally:
+        os.umask(old_umask)
+
+    assert (tmp_path / "library.json").stat().st_mode & 0o777 == 0o644
+
+
 def test_clean_non_existing_folders_from_library_removes_missing(tmp_path, monkeypatch):
     fake_lib = tmp_path / "library.json"
     # point storage.PATH_LIBRARY to our fake file
@@ -232,3 +628,18 @@ def test_clean_non_existing_folders_from_library_no_change_when_all_exist(tmp_pa
 
     written = json.loads(fake_lib.read_text(encoding="utf-8"))
     assert sorted(written.get("folders", [])) == sorted(data["folders"])
+
+
+def test_clean_non_existing_folders_from_large_library_keeps_order(tmp_path, monkeypatch):
+    fake_lib = tmp_path / "library.json"
+    monkeypatch.setattr(storage, "PATH_LIBRARY", fake_lib)
+
+    folders = [tmp_path / f"f{i}" for i in range(12)]
+    for folder in folders[::2]:
+        folder.mkdir()
+    fake_lib.write_text(json.dumps({"folders": [str(f) for f in folders]}), encoding="utf-8")
+
+    storage.clean_non_existing_folders_from_library()
+
+    written = json.loads(fake_lib.read_text(encoding="utf-8"))
+    assert written["folders"] == [str(f) for f in folders[::2]]
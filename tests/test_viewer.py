@@ -0,0 +1,330 @@
+import os
+
+import pytest
+
+from src import viewer
+from src.viewer import BOLD, BOLD_ITALIC, INLINE_CODE, ITALIC, NORMAL, parse_markdown_raw, tokenize_inline
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        ("plain text", ["plain text", NORMAL]),
+        ("a *b* c", ["a ", NORMAL, "b", ITALIC, " c", NORMAL]),
+        ("**b**", ["b", BOLD]),
+        ("***bi***", ["bi", BOLD_ITALIC]),
+        (
+            "use `x * y` here",
+            ["use ", NORMAL, "x * y", INLINE_CODE, " here", NORMAL],
+        ),
+        # unmatched markers stay in the surrounding plain run
+        ("2 * 3 = 6", ["2 * 3 = 6", NORMAL]),
+        ("a ` b", ["a ` b", NORMAL]),
+        ("", []),
+    ],
+)
+def test_tokenize_inline(line, expected):
+    assert tokenize_inline(line) == expected
+
+
+def test_tokenize_inline_respects_bounds():
+    line = "*a* [x](y) **b** tail"
+    assert tokenize_inline(line, 0, 4) == tokenize_inline(line[:4])
+    assert tokenize_inline(line, 10, 16) == tokenize_inline(line[10:16])
+    assert tokenize_inline(line, 10) == tokenize_inline(line[10:])
+
+
+def test_tokenize_inline_extends_segments():
+    segments = ["head ", NORMAL]
+    assert tokenize_inline("tail *x*", segments=segments) is segments
+    assert segments == ["head tail ", NORMAL, "x", ITALIC]
+
+
+def test_parse_markdown_raw_collects_links_and_images(tmp_path):
+    doc = parse_markdown_raw("# Title\nsee [here](http://x) now\n![pic](img.png)\n", str(tmp_path))
+
+    assert doc.links == ["http://x"]
+    assert doc.images == [("3.0", str(tmp_path / "img.png"))]
+    assert "".join(doc.segments[::2]) == "Title\nsee here now\n\n\n"
+
+
+@pytest.mark.parametrize(
+    "line, segments",
+    [
+        ("# One", ["One\n", "h1"]),
+        ("  ### Three", ["Three\n", "h3"]),
+        # deeper or unspaced markers are plain text
+        ("#### Four", ["#### Four\n", NORMAL]),
+        ("#tag", ["#tag\n", NORMAL]),
+    ],
+)
+def test_parse_markdown_raw_headings(line, segments):
+    assert parse_markdown_raw(line, "").segments == segments
+
+
+def test_parse_markdown_raw_image_indices_follow_text():
+    blocks = [f"line {i} *x*\n```\ncode\n```\nend\n![p](p{i}.png)\n" for i in range(30)]
+    doc = parse_markdown_raw("".join(blocks), "")
+
+    # each image sits at the end of the text rendered from the lines before it
+    expected = []
+    for i in range(len(blocks)):
+        head = "".join(blocks[:i]) + blocks[i][: blocks[i].index("\n![p]")]
+        text = "".join(parse_markdown_raw(head, "").segments[::2])
+        expected.append(f"{text.count(chr(10)) + 1}.{len(text) - text.rfind(chr(10)) - 1}")
+    assert [index for index, _ in doc.images] == expected
+
+
+@pytest.mark.parametrize(
+    "content, text",
+    [
+        ("a\n```\nx\n```\nb", "a\n\nx\n\nb\n"),
+        # unclosed fences run to the end of the text
+        ("a\n```\nx", "a\n\nx\n"),
+        ("a\n```\n", "a\n\n\n"),
+        ("a\n```", "a\n\n"),
+        ("```\nx\n```\n```", "\nx\n\n\n"),
+    ],
+)
+def test_parse_markdown_raw_code_fences(content, text):
+    assert "".join(parse_markdown_raw(content, "").segments[::2]) == text
+
+
+@pytest.mark.parametrize("repeat", [1, 20000])
+def test_read_text_matches_text_mode(tmp_path, repeat):
+    path = tmp_path / "a.md"
+    path.write_bytes("é line\r\nold mac\rend\n".encode("utf-8") * repeat)
+
+    with open(path, "r", encoding="utf-8") as f:
+        assert viewer.read_text(path) == f.read()
+
+
+def test_load_document_reuses_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(viewer, "PATH_CACHE", tmp_path)
+    md = tmp_path / "a.md"
+    md.write_text("# One\n", encoding="utf-8")
+
+    first = viewer.load_document(md, str(tmp_path))
+    assert len(list(tmp_path.glob("*.pkl"))) == 1
+
+    # a cached load must not parse again
+    monkeypatch.setattr(viewer, "parse_markdown", lambda *args: pytest.fail("parsed twice"))
+    assert viewer.load_document(md, str(tmp_path)) == first
+
+
+def test_load_document_cache_survives_moved_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(viewer, "PATH_CACHE", tmp_path)
+    for name in ["one", "two"]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "a.md").write_text("![pic](img/p.png)\n![abs](/abs/q.png)\n", encoding="utf-8")
+
+    first = viewer.load_document(str(tmp_path / "one" / "a.md"), str(tmp_path / "one"))
+    # the same content in another folder hits the cache, with its images resolved there
+    monkeypatch.setattr(viewer, "parse_markdown", lambda *args: pytest.fail("parsed twice"))
+    second = viewer.load_document(str(tmp_path / "two" / "a.md"), str(tmp_path / "two"))
+
+    assert len(list(tmp_path.glob("*.pkl"))) == 1
+    assert [path for _, path in first.images] == [
+        str(tmp_path / "one" / "img" / "p.png"),
+        os.path.normpath("/abs/q.png"),
+    ]
+    assert [path for _, path in second.images] == [
+        str(tmp_path / "two" / "img" / "p.png"),
+        os.path.normpath("/abs/q.png"),
+    ]
+
+
+def test_prune_document_cache_removes_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(viewer, "PATH_CACHE", tmp_path)
+    for age, name in enumerate(["new", "mid", "old"]):
+        path = tmp_path / f"{name}.pkl"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (1000 - age, 1000 - age))
+    (tmp_path / "other.tmp").write_bytes(b"x" * 1000)
+
+    viewer.prune_document_cache(max_bytes=250)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["mid.pkl", "new.pkl", "other.tmp"]
+
+
+def test_link_click_opens_url_of_tag_under_pointer(monkeypatch):
+    opened = []
+    monkeypatch.setattr(viewer.webbrowser, "open_new", opened.append)
+
+    class FakeText:
+        md_links = ["http://a", "http://b"]
+
+        def tag_names(self, index):
+            assert index == "@3,4"
+            return ("bold", "hyperlink", "hyperlink_1")
+
+    event = type("Event", (), {"widget": FakeText(), "x": 3, "y": 4})()
+    viewer._on_link_click(event)
+
+    assert opened == ["http://b"]
+
+
+class FakeImageText:
+    def __init__(self):
+        self.inserted = []
+        self.images = []
+
+    def mark_set(self, mark, index):
+        pass
+
+    def mark_gravity(self, mark, gravity):
+        pass
+
+    def insert(self, index, text):
+        self.inserted.append(text)
+
+    def image_create(self, index, image):
+        self.images.append(image)
+
+    def after(self, *args):
+        pass
+
+
+def test_insert_image_falls_back_to_pillow_when_tk_cannot_decode(tmp_path, monkeypatch):
+    submitted = []
+
+    def fail(**kwargs):
+        raise RuntimeError("couldn't recognize data in image file")
+
+    monkeypatch.setattr(viewer.tk, "PhotoImage", fail)
+    monkeypatch.setattr(viewer, "_pil_modules", lambda: (object(), object()))
+    monkeypatch.setattr(viewer, "_IMG_POOL", type("Pool", (), {"submit": lambda self, *args: submitted.append(args)})())
+    img_path = str(tmp_path / "deep.png")
+    open(img_path, "wb").close()
+
+    text_widget = FakeImageText()
+    viewer.insert_image(text_widget, "1.0", img_path, {})
+
+    assert text_widget.inserted == [viewer._IMG_PLACEHOLDER]
+    assert submitted == [(viewer._decode_image, img_path)]
+
+
+def test_insert_image_checks_known_files_without_stat(monkeypatch):
+    monkeypatch.setattr(viewer.tk, "PhotoImage", lambda file: f"decoded {file}")
+    monkeypatch.setattr(viewer.os.path, "exists", lambda path: path != "/pics/gone.png")
+    image_cache = {}
+
+    text_widget = FakeImageText()
+    # a listed picture is decoded straight away, no stat and no mtime taken
+    monkeypatch.setattr(viewer.os, "stat", lambda path: pytest.fail("stat on the rendering path"))
+    viewer.insert_image(text_widget, "1.0", "/pics/a.png", image_cache, {"/pics/a.png"})
+    # a cached picture is not read again
+    monkeypatch.setattr(viewer.tk, "PhotoImage", lambda file: pytest.fail("decoded twice"))
+    viewer.insert_image(text_widget, "2.0", "/pics/a.png", image_cache, {"/pics/a.png"})
+    viewer.insert_image(text_widget, "3.0", "/pics/gone.png", image_cache, {"/pics/a.png"})
+
+    assert image_cache == {"/pics/a.png": (None, "decoded /pics/a.png")}
+    assert text_widget.images == ["decoded /pics/a.png"] * 2
+    assert text_widget.inserted == ["[Image not found: /pics/gone.png]\n"]
+
+
+def test_drop_changed_images_keeps_only_unchanged_pictures(tmp_path):
+    listed_at = 10**15
+    mtimes = {"same.png": 5, "edited.png": 6, "old.png": 5, "fresh.png": listed_at - 1}
+    for name, mtime in mtimes.items():
+        open(tmp_path / name, "wb").close()
+        os.utime(tmp_path / name, ns=(mtime, mtime))
+    app = type("App", (), {})()
+    app.image_cache = {str(tmp_path / name): (5, name) for name in ["same.png", "edited.png", "gone.png"]}
+    # decoded since the listing, without an mtime yet
+    app.image_cache.update({str(tmp_path / name): (None, name) for name in ["old.png", "fresh.png"]})
+
+    assert viewer.MarkdownViewerApp._drop_changed_images(app, listed_at)
+    assert app.image_cache == {str(tmp_path / "same.png"): (5, "same.png"), str(tmp_path / "old.png"): (5, "old.png")}
+    assert not viewer.MarkdownViewerApp._drop_changed_images(app, listed_at)
+
+
+def test_superseded_load_does_not_render():
+    rendered = []
+    tab = type("Tab", (), {"winfo_exists": lambda self: True, "__str__": lambda self: ".tab"})()
+    app = type("App", (), {})()
+    app.root = type("Root", (), {"after": lambda self, *args: None})()
+    app.render_tab = lambda tab, doc: rendered.append(doc)
+    app._text_widgets = {}
+
+    first, second = viewer.Future(), viewer.Future()
+    app._loading = {".tab": second}
+    first.set_result("old")
+    second.set_result("new")
+    # the chain of the first load ends when a reload has moved on to the second one
+    viewer.MarkdownViewerApp._render_when_loaded(app, tab, first)
+    viewer.MarkdownViewerApp._render_when_loaded(app, tab, second)
+
+    assert rendered == ["new"]
+    assert app._loading == {}
+
+
+def test_failed_load_renders_error_and_is_retried_on_reload():
+    rendered = []
+    tab = type("Tab", (), {"winfo_exists": lambda self: True, "__str__": lambda self: ".tab"})()
+    app = type("App", (), {})()
+    app.render_tab = lambda tab, doc: rendered.append(doc)
+    app._text_widgets = {}
+    app._tabs = {"/f/a.md": tab}
+    app._mtimes = {"/f/a.md": 5}
+
+    failed = viewer.Future()
+    failed.set_exception(UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte"))
+    app._loading = {".tab": failed}
+    viewer.MarkdownViewerApp._render_when_loaded(app, tab, failed)
+
+    assert len(rendered) == 1
+    assert rendered[0].segments[0].startswith("[Could not load /f/a.md: ")
+    assert app._mtimes == {}
+
+
+def test_reemit_drops_pending_image_decodes(monkeypatch):
+    decoding = viewer.Future()
+    monkeypatch.setattr(viewer, "_pil_modules", lambda: (object(), type("ImageTk", (), {"PhotoImage": str})))
+    monkeypatch.setattr(viewer, "_IMG_POOL", type("Pool", (), {"submit": lambda self, *args: decoding})())
+
+    class FakeText(FakeImageText):
+        def __init__(self):
+            super().__init__()
+            self.marks = {"insert", "current"}
+            self.polls = []
+            self.deleted = []
+
+        def config(self, **kwargs):
+            pass
+
+        def tag_bind(self, *args):
+            return "bound"
+
+        def winfo_exists(self):
+            return True
+
+        def mark_set(self, mark, index):
+            self.marks.add(mark)
+
+        def mark_names(self):
+            return tuple(self.marks)
+
+        def mark_unset(self, mark):
+            self.marks.remove(mark)
+
+        def delete(self, start, end):
+            self.deleted.append((start, end))
+
+        def insert(self, index, *chunks):
+            self.inserted.append(chunks[0])
+
+        def after(self, ms, *args):
+            self.polls.append(args)
+
+    text_widget = FakeText()
+    viewer.emit_document(text_widget, viewer.Document([], [("1.0", "/p/a.jpg")], []), {}, {"/p/a.jpg"})
+    # the file changed and its tab is refilled before the picture is decoded
+    viewer.emit_document(text_widget, viewer.Document(["new text\n", NORMAL], [], []), {}, set())
+    decoding.set_result("decoded")
+    for args in text_widget.polls:
+        args[0](*args[1:])
+
+    assert text_widget.marks == {"insert", "current"}
+    assert text_widget.deleted == [("1.0", viewer.tk.END)] * 2
+    assert text_widget.images == []